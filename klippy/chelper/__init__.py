@@ -86,6 +86,19 @@ defs_kin_extruder = """
         , double accel_t, double cruise_t, double decel_t, double start_pos
         , double start_v, double cruise_v, double accel
         , double extra_accel_v, double extra_decel_v);
+    double extruder_move_fill_pa(struct move *m, double print_time
+        , double accel_t, double cruise_t, double decel_t
+        , double start_pos, double axis_d
+        , double start_v, double cruise_v, double accel
+        , double pressure_advance, double prev_pressure_d
+        , double move_cruise_v, double move_end_v, double max_corner_v);
+    struct extruder_lookahead_move {
+        double accel_t, cruise_t, decel_t;
+        double start_v, cruise_v, accel, max_start_v2;
+    };
+    int extruder_lookahead(struct extruder_lookahead_move *moves
+        , int flush_count, int lazy, double lookahead_t
+        , double *max_corner_v_out);
 """
 
 defs_serialqueue = """
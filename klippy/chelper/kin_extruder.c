@@ -52,3 +52,96 @@ extruder_move_fill(struct move *m, double print_time
     // Setup start distance
     m->start_pos.x = start_pos;
 }
+
+// Populate a 'struct move' with an extruder velocity trapezoid,
+// adding any extra velocity needed for pressure advance.  Returns the
+// total extruder distance of the move (including pressure advance).
+double __visible
+extruder_move_fill_pa(struct move *m, double print_time
+                      , double accel_t, double cruise_t, double decel_t
+                      , double start_pos, double axis_d
+                      , double start_v, double cruise_v, double accel
+                      , double pressure_advance, double prev_pressure_d
+                      , double move_cruise_v, double move_end_v
+                      , double max_corner_v)
+{
+    double extra_accel_v = 0., extra_decel_v = 0.;
+    if (pressure_advance) {
+        // Calculate extra_accel_v
+        if (accel_t) {
+            double npd = move_cruise_v * pressure_advance;
+            double extra_accel_d = npd - prev_pressure_d;
+            if (extra_accel_d > 0.) {
+                extra_accel_v = extra_accel_d / accel_t;
+                axis_d += extra_accel_d;
+                prev_pressure_d += extra_accel_d;
+            }
+        }
+        // Calculate extra_decel_v
+        if (decel_t && max_corner_v < move_cruise_v) {
+            double corner_v = (move_end_v > max_corner_v
+                               ? move_end_v : max_corner_v);
+            double npd = corner_v * pressure_advance;
+            double extra_decel_d = npd - prev_pressure_d;
+            if (extra_decel_d < 0.) {
+                axis_d += extra_decel_d;
+                extra_decel_v = extra_decel_d / decel_t;
+            }
+        }
+    }
+    extruder_move_fill(m, print_time, accel_t, cruise_t, decel_t, start_pos
+                       , start_v, cruise_v, accel
+                       , extra_accel_v, extra_decel_v);
+    return axis_d;
+}
+
+struct extruder_lookahead_move {
+    double accel_t, cruise_t, decel_t;
+    double start_v, cruise_v, accel, max_start_v2;
+};
+
+// Determine the maximum velocity the head will accelerate to after
+// cornering (the "max_corner_v") of each decelerating move.  Returns
+// the number of moves processed (which may be less than flush_count
+// if 'lazy' is set and there are not enough moves to look ahead).
+int __visible
+extruder_lookahead(struct extruder_lookahead_move *moves, int flush_count
+                   , int lazy, double lookahead_t, double *max_corner_v_out)
+{
+    int i;
+    for (i=0; i<flush_count; i++) {
+        struct extruder_lookahead_move *move = &moves[i];
+        max_corner_v_out[i] = 0.;
+        if (!move->decel_t)
+            continue;
+        double cruise_v = move->cruise_v, max_corner_v = 0.;
+        double sum_t = lookahead_t;
+        int j;
+        for (j=i+1; j<flush_count; j++) {
+            struct extruder_lookahead_move *fmove = &moves[j];
+            if (!fmove->max_start_v2)
+                break;
+            if (fmove->cruise_v > max_corner_v) {
+                if (!max_corner_v && !fmove->accel_t && !fmove->cruise_t)
+                    // Start timing after any full decel moves
+                    continue;
+                if (sum_t >= fmove->accel_t) {
+                    max_corner_v = fmove->cruise_v;
+                } else {
+                    double v = fmove->start_v + fmove->accel * sum_t;
+                    if (v > max_corner_v)
+                        max_corner_v = v;
+                }
+                if (max_corner_v >= cruise_v)
+                    break;
+            }
+            sum_t -= fmove->accel_t + fmove->cruise_t + fmove->decel_t;
+            if (sum_t <= 0.)
+                break;
+        }
+        if (j >= flush_count && lazy)
+            return i;
+        max_corner_v_out[i] = max_corner_v;
+    }
+    return flush_count;
+}
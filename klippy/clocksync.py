@@ -9,9 +9,91 @@ RTT_AGE = .000010 / (60. * 60.)
 DECAY = 1. / 30.
 TRANSMIT_EXTRA = .001
 
+# Exponentially decayed linear regression of mcu clock and system sent_time
+class ClockRegression:
+    def __init__(self, mcu_freq, sent_time, clock):
+        self.time_avg = sent_time
+        self.clock_avg = clock
+        self.freq = mcu_freq
+        self.time_variance = self.clock_covariance = 0.
+    def predict(self, sent_time):
+        return (sent_time - self.time_avg) * self.freq + self.clock_avg
+    def reset_variance(self, mcu_freq):
+        pass
+    def get_variance(self, prediction_variance):
+        # No covariance is tracked - use the observed prediction error
+        return prediction_variance
+    def update(self, sent_time, clock, receive_time):
+        diff_sent_time = sent_time - self.time_avg
+        self.time_avg += DECAY * diff_sent_time
+        self.time_variance = (1. - DECAY) * (
+            self.time_variance + diff_sent_time**2 * DECAY)
+        diff_clock = clock - self.clock_avg
+        self.clock_avg += DECAY * diff_clock
+        self.clock_covariance = (1. - DECAY) * (
+            self.clock_covariance + diff_sent_time * diff_clock * DECAY)
+        self.freq = self.clock_covariance / self.time_variance
+        return self.time_avg, self.clock_avg, self.freq
+    def dump_debug(self):
+        return "time_avg=%.3f(%.3f) clock_avg=%.3f(%.3f)" % (
+            self.time_avg, self.time_variance,
+            self.clock_avg, self.clock_covariance)
+
+# Standard deviation (relative to mcu_freq) of the random walk of the
+# mcu clock frequency over one second
+KALMAN_FREQ_NOISE = .000000100
+KALMAN_INITIAL_FREQ_STDDEV = .000100
+KALMAN_INITIAL_CLOCK_STDDEV = .001
+
+# Kalman filter tracking the mcu clock and frequency at system sent_time
+class ClockKalman:
+    def __init__(self, mcu_freq, sent_time, clock):
+        self.time_avg = sent_time
+        self.clock_avg = float(clock)
+        self.freq = mcu_freq
+        self.freq_noise2 = (KALMAN_FREQ_NOISE * mcu_freq)**2
+        # State covariance (clock, clock/freq, freq)
+        self.p_cc = (KALMAN_INITIAL_CLOCK_STDDEV * mcu_freq)**2
+        self.p_cf = 0.
+        self.p_ff = (KALMAN_INITIAL_FREQ_STDDEV * mcu_freq)**2
+    def predict(self, sent_time):
+        return (sent_time - self.time_avg) * self.freq + self.clock_avg
+    def reset_variance(self, mcu_freq):
+        self.p_cc = (KALMAN_INITIAL_CLOCK_STDDEV * mcu_freq)**2
+    def get_variance(self, prediction_variance):
+        # Clock variance propagated one second (about one clock query)
+        return self.p_cc + 2. * self.p_cf + self.p_ff
+    def update(self, sent_time, clock, receive_time):
+        # Propagate state to sent_time
+        dt = sent_time - self.time_avg
+        pred_clock = self.clock_avg + self.freq * dt
+        p_cc = self.p_cc + 2. * dt * self.p_cf + dt**2 * self.p_ff
+        p_cf = self.p_cf + dt * self.p_ff
+        p_ff = self.p_ff + abs(dt) * self.freq_noise2
+        # The mcu sampled its clock at some point during the round trip
+        measure_variance = (.5 * (receive_time - sent_time) * self.freq)**2
+        innovation_variance = p_cc + measure_variance
+        gain_c = p_cc / innovation_variance
+        gain_f = p_cf / innovation_variance
+        diff_clock = clock - pred_clock
+        self.time_avg = sent_time
+        self.clock_avg = pred_clock + gain_c * diff_clock
+        self.freq += gain_f * diff_clock
+        self.p_cc = (1. - gain_c) * p_cc
+        self.p_cf = (1. - gain_c) * p_cf
+        self.p_ff = p_ff - gain_f * p_cf
+        return self.time_avg, self.clock_avg, self.freq
+    def dump_debug(self):
+        return "kalman time=%.3f clock=%.3f p=(%.3f %.3f %.3f)" % (
+            self.time_avg, self.clock_avg, self.p_cc, self.p_cf, self.p_ff)
+
+CLOCK_ESTIMATORS = {'regression': ClockRegression, 'kalman': ClockKalman}
+
 class ClockSync:
-    def __init__(self, reactor):
+    def __init__(self, reactor, estimator_class=ClockRegression):
         self.reactor = reactor
+        self.estimator_class = estimator_class
+        self.estimator = None
         self.serial = None
         self.get_clock_timer = reactor.register_timer(self._get_clock_event)
         self.get_clock_cmd = self.cmd_queue = None
@@ -22,9 +104,7 @@ class ClockSync:
         # Minimum round-trip-time tracking
         self.min_half_rtt = 999999999.9
         self.min_rtt_time = 0.
-        # Linear regression of mcu clock and system sent_time
-        self.time_avg = self.time_variance = 0.
-        self.clock_avg = self.clock_covariance = 0.
+        # Prediction of mcu clock from system sent_time
         self.prediction_variance = 0.
         self.last_prediction_time = 0.
     def connect(self, serial):
@@ -33,10 +113,7 @@ class ClockSync:
         # Load initial clock and frequency
         params = serial.send_with_response('get_uptime', 'uptime')
         self.last_clock = (params['high'] << 32) | params['clock']
-        self.clock_avg = self.last_clock
-        self.time_avg = params['#sent_time']
-        self.clock_est = (self.time_avg, self.clock_avg, self.mcu_freq)
-        self.prediction_variance = (.001 * self.mcu_freq)**2
+        self.reset_estimator(params['#sent_time'], self.last_clock)
         # Enable periodic get_clock timer
         for i in range(8):
             params = serial.send_with_response('get_clock', 'clock')
@@ -46,6 +123,10 @@ class ClockSync:
         self.cmd_queue = serial.alloc_command_queue()
         serial.register_response(self._handle_clock, 'clock')
         self.reactor.update_timer(self.get_clock_timer, self.reactor.NOW)
+    def reset_estimator(self, sent_time, clock):
+        self.estimator = self.estimator_class(self.mcu_freq, sent_time, clock)
+        self.clock_est = (sent_time, clock, self.mcu_freq)
+        self.prediction_variance = (.001 * self.mcu_freq)**2
     def connect_file(self, serial, pace=False):
         self.serial = serial
         self.mcu_freq = serial.msgparser.get_constant_float('CLOCK_FREQ')
@@ -74,6 +155,8 @@ class ClockSync:
         if not sent_time:
             return
         receive_time = params['#receive_time']
+        logging.debug("clock sample %s %.6f %.6f %d", self.serial.serialport,
+                      sent_time, receive_time, clock)
         half_rtt = .5 * (receive_time - sent_time)
         aged_rtt = (sent_time - self.min_rtt_time) * RTT_AGE
         if half_rtt < self.min_half_rtt + aged_rtt:
@@ -82,8 +165,7 @@ class ClockSync:
             logging.debug("new minimum rtt %.3f: hrtt=%.6f freq=%d",
                           sent_time, half_rtt, self.clock_est[2])
         # Filter out samples that are extreme outliers
-        exp_clock = ((sent_time - self.time_avg) * self.clock_est[2]
-                     + self.clock_avg)
+        exp_clock = self.estimator.predict(sent_time)
         clock_diff2 = (clock - exp_clock)**2
         if (clock_diff2 > 25. * self.prediction_variance
             and clock_diff2 > (.000500 * self.mcu_freq)**2):
@@ -98,28 +180,24 @@ class ClockSync:
                          sent_time, self.clock_est[2], clock - exp_clock,
                          math.sqrt(self.prediction_variance))
             self.prediction_variance = (.001 * self.mcu_freq)**2
+            self.estimator.reset_variance(self.mcu_freq)
         else:
             self.last_prediction_time = sent_time
             self.prediction_variance = (
                 (1. - DECAY) * (self.prediction_variance + clock_diff2 * DECAY))
-        # Add clock and sent_time to linear regression
-        diff_sent_time = sent_time - self.time_avg
-        self.time_avg += DECAY * diff_sent_time
-        self.time_variance = (1. - DECAY) * (
-            self.time_variance + diff_sent_time**2 * DECAY)
-        diff_clock = clock - self.clock_avg
-        self.clock_avg += DECAY * diff_clock
-        self.clock_covariance = (1. - DECAY) * (
-            self.clock_covariance + diff_sent_time * diff_clock * DECAY)
-        # Update prediction from linear regression
-        new_freq = self.clock_covariance / self.time_variance
-        pred_stddev = math.sqrt(self.prediction_variance)
-        self.serial.set_clock_est(new_freq, self.time_avg + TRANSMIT_EXTRA,
-                                  int(self.clock_avg - 3. * pred_stddev))
-        self.clock_est = (self.time_avg + self.min_half_rtt,
-                          self.clock_avg, new_freq)
+        # Add clock and sent_time to the clock estimator
+        time_avg, clock_avg, new_freq = self.estimator.update(
+            sent_time, clock, receive_time)
+        self.serial.set_clock_est(new_freq, time_avg + TRANSMIT_EXTRA,
+                                  int(clock_avg - self.get_slack()))
+        self.clock_est = (time_avg + self.min_half_rtt, clock_avg, new_freq)
         #logging.debug("regr %.3f: freq=%.3f d=%d(%.3f)",
-        #              sent_time, new_freq, clock - exp_clock, pred_stddev)
+        #              sent_time, new_freq, clock - exp_clock,
+        #              math.sqrt(self.prediction_variance))
+    def get_slack(self):
+        # Margin (in clock ticks) for the uncertainty of the clock estimate
+        return 3. * math.sqrt(self.estimator.get_variance(
+            self.prediction_variance))
     # clock frequency conversions
     def print_time_to_clock(self, print_time):
         return int(print_time * self.mcu_freq)
@@ -147,14 +225,14 @@ class ClockSync:
         return self.queries_pending <= 4
     def dump_debug(self):
         sample_time, clock, freq = self.clock_est
+        estimator_debug = ""
+        if self.estimator is not None:
+            estimator_debug = self.estimator.dump_debug()
         return ("clocksync state: mcu_freq=%d last_clock=%d"
                 " clock_est=(%.3f %d %.3f) min_half_rtt=%.6f min_rtt_time=%.3f"
-                " time_avg=%.3f(%.3f) clock_avg=%.3f(%.3f)"
-                " pred_variance=%.3f" % (
+                " %s pred_variance=%.3f" % (
                     self.mcu_freq, self.last_clock, sample_time, clock, freq,
-                    self.min_half_rtt, self.min_rtt_time,
-                    self.time_avg, self.time_variance,
-                    self.clock_avg, self.clock_covariance,
+                    self.min_half_rtt, self.min_rtt_time, estimator_debug,
                     self.prediction_variance))
     def stats(self, eventtime):
         sample_time, clock, freq = self.clock_est
@@ -165,8 +243,8 @@ class ClockSync:
 # Clock syncing code for secondary MCUs (whose clocks are sync'ed to a
 # primary MCU)
 class SecondarySync(ClockSync):
-    def __init__(self, reactor, main_sync):
-        ClockSync.__init__(self, reactor)
+    def __init__(self, reactor, main_sync, estimator_class=ClockRegression):
+        ClockSync.__init__(self, reactor, estimator_class)
         self.main_sync = main_sync
         self.clock_adj = (0., 1.)
         self.last_sync_time = 0.
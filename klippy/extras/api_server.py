@@ -0,0 +1,312 @@
+# Local status subscription server on a unix domain socket
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import os, stat, socket, errno, json, logging
+
+# Requests and responses are newline terminated JSON objects.  Requests
+# have the form {"id": <id>, "method": <method>, "params": {...}} and
+# are answered with {"id": <id>, "result": ...} or {"id": <id>,
+# "error": <msg>}.  Supported methods:
+#   list_objects - returns the names of objects that provide status
+#   get_status - params {"objects": {<name>: [<field>, ...] or null}}
+#   subscribe - same params as get_status; the current values are
+#       returned and changed values are then pushed periodically as
+#       {"eventtime": <time>, "status": {<name>: {<field>: <value>}}}
+#   unsubscribe - params {"objects": [<name>, ...]} or no params to
+#       remove all subscriptions
+
+CLIENT_BUFFER_MAX = 256 * 1024
+CLIENT_REQUEST_MAX = 64 * 1024
+
+class error(Exception):
+    pass
+
+def encode(value):
+    return json.dumps(value, default=str, separators=(',', ':'))
+
+# Request handling and subscription state of a single client
+class APIClient:
+    def __init__(self, server):
+        self.server = server
+        self.subscriptions = {}
+        self.last_values = {}
+    def close(self):
+        self.server.remove_client(self)
+    def is_subscribed(self):
+        return not not self.subscriptions
+    def get_subscriptions(self):
+        return self.subscriptions
+    def process_request(self, req, eventtime):
+        req_id = None
+        try:
+            try:
+                request = json.loads(req)
+                req_id = request.get('id')
+                method = str(request['method'])
+                params = request.get('params', {})
+            except (ValueError, KeyError, AttributeError):
+                raise error("Malformed request")
+            if not isinstance(params, dict):
+                raise error("Malformed request")
+            func = getattr(self, 'req_' + method, None)
+            if func is None:
+                raise error("Unknown method '%s'" % (method,))
+            result = func(params, eventtime)
+        except error as e:
+            self.send({'id': req_id, 'error': str(e)})
+            return
+        except Exception:
+            logging.exception("api_server: error processing request")
+            self.send({'id': req_id, 'error': "Internal error"})
+            return
+        self.send({'id': req_id, 'result': result})
+    def _parse_objects(self, params):
+        objects = params.get('objects')
+        if not isinstance(objects, dict):
+            raise error("Parameter 'objects' must be a dictionary")
+        out = {}
+        for name, fields in objects.items():
+            if not self.server.has_status(name):
+                raise error("Unknown object '%s'" % (name,))
+            if fields is not None:
+                if not isinstance(fields, list):
+                    raise error("Invalid field list for '%s'" % (name,))
+                fields = [str(f) for f in fields]
+            out[str(name)] = fields
+        return out
+    def req_list_objects(self, params, eventtime):
+        return self.server.get_object_names()
+    def req_get_status(self, params, eventtime):
+        objects = self._parse_objects(params)
+        status = self.server.get_status(objects.keys(), eventtime)
+        return {name: filter_fields(status[name], fields)
+                for name, fields in objects.items()}
+    def req_subscribe(self, params, eventtime):
+        objects = self._parse_objects(params)
+        self.subscriptions.update(objects)
+        for name in objects:
+            self.last_values.pop(name, None)
+        status = self.server.get_status(objects.keys(), eventtime)
+        result = {}
+        for name, fields in objects.items():
+            result[name] = filter_fields(status[name], fields)
+            self.last_values[name] = {
+                field: encode(value) for field, value in result[name].items()}
+        self.server.check_update_timer()
+        return result
+    def req_unsubscribe(self, params, eventtime):
+        objects = params.get('objects')
+        if objects is None:
+            objects = list(self.subscriptions.keys())
+        elif not isinstance(objects, (list, dict)):
+            raise error("Parameter 'objects' must be a list")
+        for name in objects:
+            self.subscriptions.pop(name, None)
+            self.last_values.pop(name, None)
+        return list(self.subscriptions.keys())
+    # Status updates
+    def send_changes(self, status, encoded, eventtime):
+        changes = {}
+        for name, fields in self.subscriptions.items():
+            obj_status = status.get(name, {})
+            if fields is None:
+                fields = obj_status.keys()
+            last = self.last_values.setdefault(name, {})
+            for field in fields:
+                if field not in obj_status:
+                    continue
+                value = encoded[name][field]
+                if last.get(field) != value:
+                    last[field] = value
+                    changes.setdefault(name, {})[field] = obj_status[field]
+        if changes:
+            self.send({'eventtime': eventtime, 'status': changes})
+            self.flush()
+    # Output handling
+    def flush(self):
+        pass
+
+# Client connected via the unix domain socket
+class SocketClient(APIClient):
+    def __init__(self, server, sock):
+        APIClient.__init__(self, server)
+        self.reactor = server.reactor
+        self.sock = sock
+        self.partial_data = self.send_buffer = ""
+        self.is_waiting = False
+        self.fd_handle = self.reactor.register_fd(
+            sock.fileno(), self.process_received, self.flush)
+    def close(self):
+        if self.fd_handle is None:
+            return
+        self.reactor.unregister_fd(self.fd_handle)
+        self.fd_handle = None
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+        APIClient.close(self)
+    # Input handling
+    def process_received(self, eventtime):
+        try:
+            data = self.sock.recv(4096)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = ""
+        if not data:
+            self.close()
+            return
+        requests = (self.partial_data + data).split('\n')
+        self.partial_data = requests.pop()
+        if len(self.partial_data) > CLIENT_REQUEST_MAX:
+            logging.info("api_server: dropping client with oversized request")
+            self.close()
+            return
+        for req in requests:
+            if req.strip():
+                self.process_request(req, eventtime)
+        self.flush()
+    # Output handling
+    def send(self, msg):
+        self.send_buffer += encode(msg) + "\n"
+    def flush(self, eventtime=None):
+        if self.fd_handle is None:
+            return
+        if self.send_buffer:
+            try:
+                sent = self.sock.send(self.send_buffer)
+            except socket.error as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    logging.info("api_server: client write error: %s", str(e))
+                    self.close()
+                    return
+                sent = 0
+            self.send_buffer = self.send_buffer[sent:]
+            if len(self.send_buffer) > CLIENT_BUFFER_MAX:
+                logging.info("api_server: dropping unresponsive client")
+                self.close()
+                return
+        # Wait for the socket to become writable if data remains
+        is_waiting = not not self.send_buffer
+        if is_waiting != self.is_waiting:
+            self.is_waiting = is_waiting
+            self.reactor.set_fd_wake(self.fd_handle, True, is_waiting)
+
+# Client that issues requests via the API_REQUEST g-code command
+class GCodeClient(APIClient):
+    def __init__(self, server, gcode):
+        APIClient.__init__(self, server)
+        self.gcode = gcode
+    def send(self, msg):
+        self.gcode.respond_info("api: " + encode(msg))
+
+def filter_fields(obj_status, fields):
+    if fields is None:
+        return dict(obj_status)
+    return {field: obj_status[field] for field in fields
+            if field in obj_status}
+
+class APIServer:
+    def __init__(self, config):
+        self.printer = config.get_printer()
+        self.reactor = self.printer.get_reactor()
+        self.socket_path = os.path.normpath(os.path.expanduser(
+            config.get('socket_path', '/tmp/klippy_api')))
+        self.update_interval = config.getfloat(
+            'update_interval', .250, minval=.025)
+        self.clients = []
+        self.update_timer = self.reactor.register_timer(self.update_clients)
+        self.timer_active = False
+        # Create listening socket (removing a stale socket file)
+        try:
+            if stat.S_ISSOCK(os.stat(self.socket_path).st_mode):
+                os.unlink(self.socket_path)
+        except os.error:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.setblocking(0)
+        try:
+            self.sock.bind(self.socket_path)
+        except socket.error as e:
+            self.sock.close()
+            raise config.error("Unable to create api socket '%s': %s" % (
+                self.socket_path, str(e)))
+        self.sock.listen(4)
+        self.fd_handle = self.reactor.register_fd(
+            self.sock.fileno(), self.handle_accept)
+        self.printer.register_event_handler("klippy:disconnect",
+                                            self.handle_disconnect)
+        # Register commands
+        self.gcode = self.printer.lookup_object('gcode')
+        self.gcode_client = GCodeClient(self, self.gcode)
+        self.clients.append(self.gcode_client)
+        self.gcode.register_command("API_REQUEST", self.cmd_API_REQUEST,
+                                    desc=self.cmd_API_REQUEST_help)
+    def handle_accept(self, eventtime):
+        try:
+            sock, addr = self.sock.accept()
+        except socket.error:
+            return
+        sock.setblocking(0)
+        self.clients.append(SocketClient(self, sock))
+    def handle_disconnect(self):
+        for client in list(self.clients):
+            client.close()
+        if self.fd_handle is not None:
+            self.reactor.unregister_fd(self.fd_handle)
+            self.fd_handle = None
+            self.sock.close()
+            try:
+                os.unlink(self.socket_path)
+            except os.error:
+                pass
+    def remove_client(self, client):
+        if client in self.clients:
+            self.clients.remove(client)
+    cmd_API_REQUEST_help = "Issue a status API request from the terminal"
+    def cmd_API_REQUEST(self, params):
+        method = self.gcode.get_str('METHOD', params)
+        request = '{"method":%s,"params":%s}' % (
+            encode(method.lower()), params.get('PARAMS', '{}'))
+        self.gcode_client.process_request(request, self.reactor.monotonic())
+    # Status lookup
+    def has_status(self, name):
+        obj = self.printer.lookup_object(name, None)
+        return obj is not None and hasattr(obj, 'get_status')
+    def get_object_names(self):
+        return [name for name, obj in self.printer.lookup_objects()
+                if hasattr(obj, 'get_status')]
+    def get_status(self, names, eventtime):
+        status = {}
+        for name in names:
+            obj = self.printer.lookup_object(name, None)
+            if obj is not None:
+                status[name] = obj.get_status(eventtime)
+        return status
+    # Periodic update of subscribed clients
+    def check_update_timer(self):
+        if not self.timer_active:
+            self.timer_active = True
+            self.reactor.update_timer(self.update_timer, self.reactor.NOW)
+    def update_clients(self, eventtime):
+        clients = [c for c in self.clients if c.is_subscribed()]
+        if not clients:
+            self.timer_active = False
+            return self.reactor.NEVER
+        # Query each subscribed object once and share it between clients
+        names = set()
+        for client in clients:
+            names.update(client.get_subscriptions().keys())
+        status = self.get_status(names, eventtime)
+        encoded = {name: {field: encode(value)
+                          for field, value in obj_status.items()}
+                   for name, obj_status in status.items()}
+        for client in clients:
+            client.send_changes(status, encoded, eventtime)
+        return eventtime + self.update_interval
+
+def load_config(config):
+    return APIServer(config)
@@ -513,17 +513,55 @@ class MoveSplitter:
         self.next_pos = tuple(next_pos)
         self.current_pos = list(prev_pos)
         self.z_factor = factor
-        self.z_offset = self._calc_z_offset(prev_pos)
         self.traverse_complete = False
-        self.distance_checked = 0.
         axes_d = [self.next_pos[i] - self.prev_pos[i] for i in range(4)]
         self.total_move_length = math.sqrt(sum([d*d for d in axes_d[:3]]))
         self.axis_move = [not isclose(d, 0., abs_tol=1e-10) for d in axes_d]
+        self.splits = []
+        if self.axis_move[0] or self.axis_move[1]:
+            # X and/or Y axis move, split if necessary
+            self.splits = self._calc_splits()
+        self.split_index = 0
     def _calc_z_offset(self, pos):
         z = self.z_mesh.calc_z(pos[0], pos[1])
         return self.z_factor * z + self.z_mesh.mesh_offset
-    def _set_next_move(self, distance_from_prev):
-        t = distance_from_prev / self.total_move_length
+    def _calc_splits(self):
+        # Find the split points of the move such that the piecewise
+        # linear path stays within split_delta_z of the mesh surface
+        tol = .5 * self.split_delta_z / self.z_factor
+        min_t = self.move_check_distance / self.total_move_length
+        profile = self.z_mesh.calc_move_profile(
+            self.prev_pos[0], self.prev_pos[1],
+            self.next_pos[0], self.next_pos[1])
+        # Within a mesh cell the surface height along the move is a
+        # quadratic - subdivide it until each chord is within tol
+        points = [profile[0][:2]]
+        for t, z, curv in profile[1:]:
+            prev_t, prev_z = points[-1]
+            w = t - prev_t
+            count = int(math.ceil(w * math.sqrt(abs(curv) / (4. * tol))))
+            slope = (z - prev_z) / w - curv * w
+            for i in range(1, count):
+                s = w * i / count
+                points.append((prev_t + s, prev_z + (slope + curv * s) * s))
+            points.append((t, z))
+        # Greedily extend each split for as long as a straight line
+        # can pass within tol of every skipped point
+        splits = []
+        start_t, start_z = prev_t, prev_z = points[0]
+        low, high = -99999999.9, 99999999.9
+        for t, z in points[1:]:
+            slope = (z - start_z) / (t - start_t)
+            if not low <= slope <= high and prev_t - start_t >= min_t:
+                splits.append((prev_t, prev_z))
+                start_t, start_z = prev_t, prev_z
+                low, high = -99999999.9, 99999999.9
+            dt = t - start_t
+            low = max(low, (z - tol - start_z) / dt)
+            high = min(high, (z + tol - start_z) / dt)
+            prev_t, prev_z = t, z
+        return splits
+    def _set_next_move(self, t):
         if t > 1. or t < 0.:
             raise self.gcode.error(
                 "bed_mesh: Slice distance is negative "
@@ -534,24 +572,19 @@ class MoveSplitter:
                     t, self.prev_pos[i], self.next_pos[i])
     def split(self):
         if not self.traverse_complete:
-            if self.axis_move[0] or self.axis_move[1]:
-                # X and/or Y axis move, traverse if necessary
-                while self.distance_checked + self.move_check_distance \
-                        < self.total_move_length:
-                    self.distance_checked += self.move_check_distance
-                    self._set_next_move(self.distance_checked)
-                    next_z = self._calc_z_offset(self.current_pos)
-                    if abs(next_z - self.z_offset) >= self.split_delta_z:
-                        self.z_offset = next_z
-                        return self.current_pos[0], self.current_pos[1], \
-                            self.current_pos[2] + self.z_offset, \
-                            self.current_pos[3]
+            if self.split_index < len(self.splits):
+                t, z = self.splits[self.split_index]
+                self.split_index += 1
+                self._set_next_move(t)
+                z_offset = self.z_factor * z + self.z_mesh.mesh_offset
+                return self.current_pos[0], self.current_pos[1], \
+                    self.current_pos[2] + z_offset, self.current_pos[3]
             # end of move reached
             self.current_pos[:] = self.next_pos
-            self.z_offset = self._calc_z_offset(self.current_pos)
+            z_offset = self._calc_z_offset(self.current_pos)
             # Its okay to add Z-Offset to the final move, since it will not be
             # used again.
-            self.current_pos[2] += self.z_offset
+            self.current_pos[2] += z_offset
             self.traverse_complete = True
             return self.current_pos
         else:
@@ -652,6 +685,63 @@ class ZMesh:
         else:
             # No mesh table generated, no z-adjustment
             return 0.
+    def calc_move_profile(self, start_x, start_y, end_x, end_y):
+        # Intersect a line with the mesh grid.  Between consecutive
+        # grid crossings the bilinear surface height along the line is
+        # a quadratic in the move fraction t.  Returns a list of
+        # (t, z, curvature) for the start and for the end of each cell.
+        if self.mesh_z_table is None:
+            return [(0., 0., 0.), (1., 0., 0.)]
+        tbl = self.mesh_z_table
+        dx = end_x - start_x
+        dy = end_y - start_y
+        breaks = (self._get_grid_crossings(start_x, dx, 0)
+                  + self._get_grid_crossings(start_y, dy, 1))
+        breaks = sorted(set([t for t in breaks if 0. < t < 1.] + [1.]))
+        profile = []
+        prev_t = 0.
+        for t in breaks:
+            # Find the cell from the midpoint of this part of the move
+            tm = .5 * (prev_t + t)
+            tx, xidx = self._get_linear_index(start_x + dx * tm, 0)
+            ty, yidx = self._get_linear_index(start_y + dy * tm, 1)
+            z00, z10 = tbl[yidx][xidx], tbl[yidx][xidx+1]
+            z01, z11 = tbl[yidx+1][xidx], tbl[yidx+1][xidx+1]
+            zm = lerp(ty, lerp(tx, z00, z10), lerp(tx, z01, z11))
+            # Cell coordinates do not change outside the mesh
+            dtx = dty = 0.
+            if 0. < tx < 1.:
+                dtx = dx / self.mesh_x_dist
+            if 0. < ty < 1.:
+                dty = dy / self.mesh_y_dist
+            k = z00 - z10 - z01 + z11
+            slope = (z10 - z00 + k * ty) * dtx + (z01 - z00 + k * tx) * dty
+            curv = k * dtx * dty
+            if not profile:
+                s = prev_t - tm
+                profile.append((prev_t, zm + (slope + curv * s) * s, 0.))
+            s = t - tm
+            profile.append((t, zm + (slope + curv * s) * s, curv))
+            prev_t = t
+        return profile
+    def _get_grid_crossings(self, start, delta, axis):
+        # Return the move fractions where a coordinate crosses a grid line
+        if isclose(delta, 0., abs_tol=1e-10):
+            return []
+        if axis == 0:
+            mesh_min = self.mesh_x_min
+            mesh_cnt = self.mesh_x_count
+            mesh_dist = self.mesh_x_dist
+        else:
+            mesh_min = self.mesh_y_min
+            mesh_cnt = self.mesh_y_count
+            mesh_dist = self.mesh_y_dist
+        low = (min(start, start + delta) - mesh_min) / mesh_dist
+        high = (max(start, start + delta) - mesh_min) / mesh_dist
+        first = max(int(math.floor(low)) + 1, 0)
+        last = min(int(math.ceil(high)) - 1, mesh_cnt - 1)
+        return [(mesh_min + idx * mesh_dist - start) / delta
+                for idx in range(first, last + 1)]
     def get_z_range(self):
         if self.mesh_z_table is not None:
             mesh_min = min([min(x) for x in self.mesh_z_table])
@@ -688,23 +778,27 @@ class ZMesh:
              for i in range(self.mesh_x_count)]
              for j in range(self.mesh_y_count)]
         xpts, ypts = self._get_lagrange_coords(z_table)
+        # The lagrange terms only depend on the coordinate, so
+        # calculate them once for each interpolated row and column
+        x_terms = [
+            (j, self._get_lagrange_terms(xpts, self.get_x_coordinate(j)))
+            for j in range(self.mesh_x_count) if j % x_mult]
+        y_terms = [
+            (j, self._get_lagrange_terms(ypts, self.get_y_coordinate(j)))
+            for j in range(self.mesh_y_count) if j % y_mult]
         # Interpolate X coordinates
-        for i in range(self.mesh_y_count):
+        for i in range(0, self.mesh_y_count, y_mult):
             # only interpolate X-rows that have probed coordinates
-            if i % y_mult != 0:
-                continue
-            for j in range(self.mesh_x_count):
-                if j % x_mult == 0:
-                    continue
-                x = self.get_x_coordinate(j)
-                self.mesh_z_table[i][j] = self._calc_lagrange(xpts, x, i, 0)
+            x_row = self.mesh_z_table[i]
+            zpts = x_row[::x_mult]
+            for j, terms in x_terms:
+                x_row[j] = self._calc_lagrange(zpts, terms)
         # Interpolate Y coordinates
         for i in range(self.mesh_x_count):
-            for j in range(self.mesh_y_count):
-                if j % y_mult == 0:
-                    continue
-                y = self.get_y_coordinate(j)
-                self.mesh_z_table[j][i] = self._calc_lagrange(ypts, y, i, 1)
+            zpts = [self.mesh_z_table[j][i]
+                    for j in range(0, self.mesh_y_count, y_mult)]
+            for j, terms in y_terms:
+                self.mesh_z_table[j][i] = self._calc_lagrange(zpts, terms)
     def _get_lagrange_coords(self, z_table):
         xpts = []
         ypts = []
@@ -713,9 +807,9 @@ class ZMesh:
         for j in range(self.probe_params['y_count']):
             ypts.append(self.get_y_coordinate(j * self.y_mult))
         return xpts, ypts
-    def _calc_lagrange(self, lpts, c, vec, axis=0):
+    def _get_lagrange_terms(self, lpts, c):
         pt_cnt = len(lpts)
-        total = 0.
+        terms = []
         for i in range(pt_cnt):
             n = 1.
             d = 1.
@@ -724,12 +818,11 @@ class ZMesh:
                     continue
                 n *= (c - lpts[j])
                 d *= (lpts[i] - lpts[j])
-            if axis == 0:
-                # Calc X-Axis
-                z = self.mesh_z_table[vec][i*self.x_mult]
-            else:
-                # Calc Y-Axis
-                z = self.mesh_z_table[i*self.y_mult][vec]
+            terms.append((n, d))
+        return terms
+    def _calc_lagrange(self, zpts, terms):
+        total = 0.
+        for z, (n, d) in zip(zpts, terms):
             total += z * n / d
         return total
     def _sample_bicubic(self, z_table):
@@ -774,19 +867,12 @@ class ZMesh:
             p2 = p3 = x_row[last_pt + x_mult]
             t = (x - last_pt) / float(x_mult)
         else:
-            found = False
-            for i in range(x_mult, last_pt, x_mult):
-                if x > i and x < (i + x_mult):
-                    p0 = x_row[i - x_mult]
-                    p1 = x_row[i]
-                    p2 = x_row[i + x_mult]
-                    p3 = x_row[i + 2*x_mult]
-                    t = (x - i) / float(x_mult)
-                    found = True
-                    break
-            if not found:
-                raise BedMeshError(
-                    "bed_mesh: Error finding x control points")
+            i = x - x % x_mult
+            p0 = x_row[i - x_mult]
+            p1 = x_row[i]
+            p2 = x_row[i + x_mult]
+            p3 = x_row[i + 2*x_mult]
+            t = (x - i) / float(x_mult)
         return p0, p1, p2, p3, t
     def _get_y_ctl_pts(self, x, y):
         # Fetch control points and t for a Y value in the mesh
@@ -804,19 +890,12 @@ class ZMesh:
             p2 = p3 = y_col[last_pt + y_mult][x]
             t = (y - last_pt) / float(y_mult)
         else:
-            found = False
-            for i in range(y_mult, last_pt, y_mult):
-                if y > i and y < (i + y_mult):
-                    p0 = y_col[i - y_mult][x]
-                    p1 = y_col[i][x]
-                    p2 = y_col[i + y_mult][x]
-                    p3 = y_col[i + 2*y_mult][x]
-                    t = (y - i) / float(y_mult)
-                    found = True
-                    break
-            if not found:
-                raise BedMeshError(
-                    "bed_mesh: Error finding y control points")
+            i = y - y % y_mult
+            p0 = y_col[i - y_mult][x]
+            p1 = y_col[i][x]
+            p2 = y_col[i + y_mult][x]
+            p3 = y_col[i + 2*y_mult][x]
+            t = (y - i) / float(y_mult)
         return p0, p1, p2, p3, t
     def _cardinal_spline(self, p, tension):
         t = p[4]
@@ -54,25 +54,18 @@ class BedTiltCalibrate:
     def cmd_BED_TILT_CALIBRATE(self, params):
         self.probe_helper.start_probe(params)
     def probe_finalize(self, offsets, positions):
-        # Setup for coordinate descent analysis
+        # Fit a plane to the probed positions
         z_offset = offsets[2]
         logging.info("Calculating bed_tilt with: %s", positions)
         params = { 'x_adjust': self.bedtilt.x_adjust,
                    'y_adjust': self.bedtilt.y_adjust,
                    'z_adjust': z_offset }
         logging.info("Initial bed_tilt parameters: %s", params)
-        # Perform coordinate descent
         def adjusted_height(pos, params):
             x, y, z = pos
             return (z - x*params['x_adjust'] - y*params['y_adjust']
                     - params['z_adjust'])
-        def errorfunc(params):
-            total_error = 0.
-            for pos in positions:
-                total_error += adjusted_height(pos, params)**2
-            return total_error
-        new_params = mathutil.coordinate_descent(
-            params.keys(), params, errorfunc)
+        new_params = mathutil.plane_fit(positions, params)
         # Update current bed_tilt calculations
         x_adjust = new_params['x_adjust']
         y_adjust = new_params['y_adjust']
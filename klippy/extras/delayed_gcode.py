@@ -31,7 +31,7 @@ class DelayedGcode:
     def _gcode_timer_event(self, eventtime):
         self.inside_timer = True
         try:
-            self.gcode.run_script(self.timer_gcode.render())
+            self.gcode.run_script(self.timer_gcode.render(eventtime=eventtime))
         except Exception:
             logging.exception("Script running error")
         nextwake = self.reactor.NEVER
@@ -83,6 +83,9 @@ MeasureRidgeRadius = 5. - .5
 # How much to prefer a distance measurement over a height measurement
 MEASURE_WEIGHT = 0.5
 
+# Available solvers for the delta parameters
+SOLVERS = ['descent', 'lm']
+
 # Convert distance measurements made on the calibration object to
 # 3-tuples of (actual_distance, stable_position1, stable_position2)
 def measurements_to_distances(measured_params, delta_params):
@@ -162,6 +165,7 @@ class DeltaCalibrate:
             distance_pos1 = load_config_stable(config, "distance%d_pos1" % (i,))
             distance_pos2 = load_config_stable(config, "distance%d_pos2" % (i,))
             self.last_distances.append((dist, distance_pos1, distance_pos2))
+        self.solver = 'descent'
         # Register gcode commands
         self.gcode = self.printer.lookup_object('gcode')
         self.gcode.register_command('DELTA_CALIBRATE', self.cmd_DELTA_CALIBRATE,
@@ -201,9 +205,10 @@ class DeltaCalibrate:
         probe_positions = [(z_offset, calc_stable_position(p, delta_params))
                            for p in positions]
         # Perform analysis
-        self.calculate_params(probe_positions, self.last_distances)
-    def calculate_params(self, probe_positions, distances):
-        # Setup for coordinate descent analysis
+        self.calculate_params(probe_positions, self.last_distances,
+                              self.solver)
+    def calculate_params(self, probe_positions, distances, solver):
+        # Setup for analysis
         kin = self.printer.lookup_object('toolhead').get_kinematics()
         params = kin.get_calibrate_params()
         orig_delta_params = build_delta_params(params)
@@ -216,27 +221,42 @@ class DeltaCalibrate:
         if distances:
             adj_params += ('arm_a', 'arm_b', 'arm_c')
             z_weight = len(distances) / (MEASURE_WEIGHT * len(probe_positions))
-        # Perform coordinate descent
-        def delta_errorfunc(params):
+        z_factor = math.sqrt(z_weight)
+        def delta_residuals(params):
             # Build new delta_params for params under test
             delta_params = build_delta_params(params)
             # Calculate z height errors
-            total_error = 0.
+            residuals = []
             for z_offset, stable_pos in probe_positions:
                 x, y, z = get_position_from_stable(stable_pos, delta_params)
-                total_error += (z - z_offset)**2
-            total_error *= z_weight
+                residuals.append((z - z_offset) * z_factor)
             # Calculate distance errors
             for dist, stable_pos1, stable_pos2 in distances:
                 x1, y1, z1 = get_position_from_stable(stable_pos1, delta_params)
                 x2, y2, z2 = get_position_from_stable(stable_pos2, delta_params)
                 d = math.sqrt((x1-x2)**2 + (y1-y2)**2 + (z1-z2)**2)
-                total_error += (d - dist)**2
-            return total_error
-        new_params = mathutil.background_coordinate_descent(
-            self.printer, adj_params, params, delta_errorfunc)
+                residuals.append(d - dist)
+            return residuals
+        def delta_errorfunc(params):
+            return sum([r**2 for r in delta_residuals(params)])
+        start_time = self.printer.get_reactor().monotonic()
+        rounds_msg = ""
+        if solver == 'lm':
+            # Perform Levenberg-Marquardt
+            new_params, rounds = mathutil.background_calc(
+                self.printer, mathutil.levenberg_marquardt,
+                adj_params, params, delta_residuals)
+            rounds_msg = ", %d iterations" % (rounds,)
+        else:
+            # Perform coordinate descent
+            new_params = mathutil.background_coordinate_descent(
+                self.printer, adj_params, params, delta_errorfunc)
+        calc_time = self.printer.get_reactor().monotonic() - start_time
         # Log and report results
         logging.info("Calculated delta_calibrate parameters: %s", new_params)
+        self.gcode.respond_info(
+            "delta_calibrate solver %s: residual %.9f (%.3fs%s)" % (
+                solver, delta_errorfunc(new_params), calc_time, rounds_msg))
         new_delta_params = build_delta_params(new_params)
         for z_offset, spos in probe_positions:
             logging.info("height orig: %.6f new: %.6f goal: %.6f",
@@ -270,8 +290,14 @@ class DeltaCalibrate:
         self.save_state(probe_positions, distances, new_params)
     cmd_DELTA_CALIBRATE_help = "Delta calibration script"
     def cmd_DELTA_CALIBRATE(self, params):
+        self.solver = self.get_solver(params)
         self.probe_helper.start_probe(params)
-    def do_extended_calibration(self):
+    def get_solver(self, params):
+        solver = self.gcode.get_str('SOLVER', params, 'descent').lower()
+        if solver not in SOLVERS:
+            raise self.gcode.error("Unknown solver '%s'" % (solver,))
+        return solver
+    def do_extended_calibration(self, solver):
         # Extract distance positions
         if len(self.delta_analyze_entry) <= 1:
             distances = self.last_distances
@@ -286,7 +312,7 @@ class DeltaCalibrate:
             raise self.gcode.error(
                 "Must run basic calibration with DELTA_CALIBRATE first")
         # Perform analysis
-        self.calculate_params(self.last_probe_positions, distances)
+        self.calculate_params(self.last_probe_positions, distances, solver)
     cmd_DELTA_ANALYZE_help = "Extended delta calibration tool"
     def cmd_DELTA_ANALYZE(self, params):
         # Parse distance measurements
@@ -312,7 +338,7 @@ class DeltaCalibrate:
             actions = {'extended': 1}
             if action not in actions:
                 raise self.gcode.error("Unknown calibrate action")
-            self.do_extended_calibration()
+            self.do_extended_calibration(self.get_solver(params))
 
 def load_config(config):
     return DeltaCalibrate(config)
@@ -31,6 +31,8 @@ class PrinterLCD:
         # screen updating
         self.screen_update_timer = self.reactor.register_timer(
             self.screen_update_event)
+        self.widgets = []
+        self.drawn_widgets = None
         # Register commands
         self.gcode = self.printer.lookup_object('gcode')
         self.gcode.register_command('M73', self.cmd_M73)
@@ -59,12 +61,44 @@ class PrinterLCD:
     # Get menu instance
     def get_menu(self):
         return self.menu
-    # Graphics drawing
-    def animate_glyphs(self, eventtime, x, y, glyph_name, do_animate):
+    # Widget tracking - the screen is made of named widgets and a widget
+    # is only redrawn when its position or parameters change
+    def add_widget(self, name, x, y, draw_func, *args):
+        self.widgets.append((name, (x, y, draw_func, args)))
+    def add_text(self, name, x, y, text):
+        self.add_widget(name, x, y, self.draw_text, text)
+    def add_glyph(self, name, x, y, glyph_name):
+        self.add_widget(name, x, y, self.draw_glyph, glyph_name)
+    def render_widgets(self):
+        lcd_chip = self.lcd_chip
+        drawn = self.drawn_widgets
+        if drawn is None:
+            # Screen contents unknown - redraw everything
+            lcd_chip.clear()
+            drawn = {}
+        widgets = dict(self.widgets)
+        # Erase widgets that changed or are no longer shown
+        for name, (params, width) in drawn.items():
+            if widgets.get(name) != params:
+                lcd_chip.clear_area(params[0], params[1], width)
+                del drawn[name]
+        # Draw new and changed widgets
+        for name, params in self.widgets:
+            if name not in drawn:
+                x, y, draw_func, args = params
+                drawn[name] = (params, draw_func(x, y, *args))
+        self.drawn_widgets = drawn
+    # Graphics drawing (each returns the number of columns drawn)
+    def draw_glyph(self, x, y, glyph_name):
+        return self.lcd_chip.write_glyph(x, y, glyph_name)
+    def animate_glyphs(self, name, eventtime, x, y, glyph_name, do_animate):
         frame = do_animate and int(eventtime) & 1
-        self.lcd_chip.write_glyph(x, y, glyph_name + str(frame + 1))
+        self.add_glyph(name, x, y, glyph_name + str(frame + 1))
+    def draw_progress(self, x, y, width, text, value):
+        self.draw_text(x, y, text)
+        self.draw_progress_bar(x, y, width, value)
+        return width
     def draw_progress_bar(self, x, y, width, value):
-        value = int(value * 100.)
         data = [0x00] * width
         char_pcnt = int(100/width)
         for i in range(width):
@@ -85,45 +119,48 @@ class PrinterLCD:
         # update menu component
         ret = self.menu.screen_update_event(eventtime)
         if ret:
+            # The menu draws over the whole screen
+            self.drawn_widgets = None
             return ret
         # update all else
-        self.lcd_chip.clear()
+        self.widgets = []
         if self.lcd_type == 'hd44780':
             self.screen_update_hd44780(eventtime)
         else:
             self.screen_update_128x64(eventtime)
+        self.render_widgets()
         self.lcd_chip.flush()
         return eventtime + .500
     def screen_update_hd44780(self, eventtime):
-        lcd_chip = self.lcd_chip
         # Heaters
         if self.extruder0 is not None:
             info = self.extruder0.get_heater().get_status(eventtime)
-            lcd_chip.write_glyph(0, 0, 'extruder')
-            self.draw_heater(1, 0, info)
+            self.add_glyph('extruder0_icon', 0, 0, 'extruder')
+            self.add_text('extruder0', 1, 0, self.format_heater(info))
         if self.extruder1 is not None:
             info = self.extruder1.get_heater().get_status(eventtime)
-            lcd_chip.write_glyph(0, 1, 'extruder')
-            self.draw_heater(1, 1, info)
+            self.add_glyph('extruder1_icon', 0, 1, 'extruder')
+            self.add_text('extruder1', 1, 1, self.format_heater(info))
         if self.heater_bed is not None:
             info = self.heater_bed.get_status(eventtime)
-            lcd_chip.write_glyph(10, 0, 'bed')
-            self.draw_heater(11, 0, info)
+            self.add_glyph('bed_icon', 10, 0, 'bed')
+            self.add_text('bed', 11, 0, self.format_heater(info))
         # Fan speed
         if self.fan is not None:
             info = self.fan.get_status(eventtime)
-            lcd_chip.write_text(10, 1, "Fan")
-            self.draw_percent(14, 1, 4, info['speed'])
+            self.add_text('fan_icon', 10, 1, "Fan")
+            self.add_text('fan', 14, 1, self.format_percent(4, info['speed']))
         # G-Code speed factor
         gcode_info = self.gcode.get_status(eventtime)
-        lcd_chip.write_glyph(0, 2, 'feedrate')
-        self.draw_percent(1, 2, 4, gcode_info['speed_factor'])
+        self.add_glyph('feedrate_icon', 0, 2, 'feedrate')
+        self.add_text('feedrate', 1, 2,
+                      self.format_percent(4, gcode_info['speed_factor']))
         # Print progress
         progress = None
         toolhead_info = self.toolhead.get_status(eventtime)
         if self.progress is not None:
             progress = self.progress / 100.
-            lcd_chip.write_glyph(8, 2, 'usb')
+            self.add_glyph('progress_icon', 8, 2, 'usb')
             if toolhead_info['status'] != "Printing":
                 # 5 second timeout when not printing
                 self.prg_time -= .5
@@ -132,37 +169,41 @@ class PrinterLCD:
         elif self.sdcard is not None:
             info = self.sdcard.get_status(eventtime)
             progress = info['progress']
-            lcd_chip.write_glyph(8, 2, 'sd')
+            self.add_glyph('progress_icon', 8, 2, 'sd')
         if progress is not None:
-            self.draw_percent(9, 2, 4, progress)
-        lcd_chip.write_glyph(14, 2, 'clock')
-        self.draw_time(15, 2, toolhead_info['printing_time'])
-        self.draw_status(0, 3, gcode_info, toolhead_info)
+            self.add_text('progress', 9, 2, self.format_percent(4, progress))
+        self.add_glyph('time_icon', 14, 2, 'clock')
+        self.add_text('time', 15, 2,
+                      self.format_time(toolhead_info['printing_time']))
+        self.add_text('status', 0, 3,
+                      self.get_status_text(gcode_info, toolhead_info))
     def screen_update_128x64(self, eventtime):
         # Heaters
         if self.extruder0 is not None:
             info = self.extruder0.get_heater().get_status(eventtime)
-            self.lcd_chip.write_glyph(0, 0, 'extruder')
-            self.draw_heater(2, 0, info)
+            self.add_glyph('extruder0_icon', 0, 0, 'extruder')
+            self.add_text('extruder0', 2, 0, self.format_heater(info))
         extruder_count = 1
         if self.extruder1 is not None:
             info = self.extruder1.get_heater().get_status(eventtime)
-            self.lcd_chip.write_glyph(0, 1, 'extruder')
-            self.draw_heater(2, 1, info)
+            self.add_glyph('extruder1_icon', 0, 1, 'extruder')
+            self.add_text('extruder1', 2, 1, self.format_heater(info))
             extruder_count = 2
         if self.heater_bed is not None:
             info = self.heater_bed.get_status(eventtime)
             if info['target']:
-                self.animate_glyphs(eventtime, 0, extruder_count,
+                self.animate_glyphs('bed_icon', eventtime, 0, extruder_count,
                                     'bed_heat', True)
             else:
-                self.lcd_chip.write_glyph(0, extruder_count, 'bed')
-            self.draw_heater(2, extruder_count, info)
+                self.add_glyph('bed_icon', 0, extruder_count, 'bed')
+            self.add_text('bed', 2, extruder_count, self.format_heater(info))
         # Fan speed
         if self.fan is not None:
             info = self.fan.get_status(eventtime)
-            self.animate_glyphs(eventtime, 10, 0, 'fan', info['speed'] != 0.)
-            self.draw_percent(12, 0, 4, info['speed'], '>')
+            self.animate_glyphs('fan_icon', eventtime, 10, 0, 'fan',
+                                info['speed'] != 0.)
+            self.add_text('fan', 12, 0,
+                          self.format_percent(4, info['speed'], '>'))
         # SD card print progress
         progress = None
         toolhead_info = self.toolhead.get_status(eventtime)
@@ -181,13 +222,15 @@ class PrinterLCD:
                 x, y, width = 0, 2, 10
             else:
                 x, y, width = 10, 1, 6
-            self.draw_percent(x, y, width, progress, '^')
-            self.draw_progress_bar(x, y, width, progress)
+            self.add_widget('progress', x, y, self.draw_progress, width,
+                            self.format_percent(width, progress, '^'),
+                            int(progress * 100.))
         # G-Code speed factor
         gcode_info = self.gcode.get_status(eventtime)
         if extruder_count == 1:
-            self.lcd_chip.write_glyph(10, 1, 'feedrate')
-            self.draw_percent(12, 1, 4, gcode_info['speed_factor'], '>')
+            self.add_glyph('feedrate_icon', 10, 1, 'feedrate')
+            self.add_text('feedrate', 12, 1, self.format_percent(
+                4, gcode_info['speed_factor'], '>'))
         # Printing time and status
         printing_time = toolhead_info['printing_time']
         remaining_time = None
@@ -195,12 +238,14 @@ class PrinterLCD:
             remaining_time = int(printing_time / progress) - printing_time
         # switch mode every 6s
         if remaining_time is not None and int(eventtime) % 12 < 6:
-            self.lcd_chip.write_text(10, 2, "-")
-            self.draw_time(11, 2, remaining_time)
+            self.add_text('time', 10, 2,
+                          "-" + self.format_time(remaining_time))
         else:
             offset = 1 if printing_time < 100 * 60 * 60 else 0
-            self.draw_time(10 + offset, 2, printing_time)
-        self.draw_status(0, 3, gcode_info, toolhead_info)
+            self.add_text('time', 10 + offset, 2,
+                          self.format_time(printing_time))
+        self.add_text('status', 0, 3,
+                      self.get_status_text(gcode_info, toolhead_info))
     # Screen update helpers
     def draw_text(self, x, y, mixed_text):
         pos = x
@@ -212,35 +257,33 @@ class PrinterLCD:
             else:
                 # write glyph
                 pos += self.lcd_chip.write_glyph(pos, y, text)
-    def draw_heater(self, x, y, info):
+        return pos - x
+    def format_heater(self, info):
         temperature, target = info['temperature'], info['target']
         if target and abs(temperature - target) > 2.:
-            self.draw_text(x, y, "%3.0f~right_arrow~%.0f~degrees~" % (
-                temperature, target))
-        else:
-            self.draw_text(x, y, "%3.0f~degrees~" % (temperature,))
-    def draw_percent(self, x, y, width, value, align='^'):
-        self.lcd_chip.write_text(x, y, '{:{}{}.0%}'.format(value, align, width))
-    def draw_time(self, x, y, seconds):
+            return "%3.0f~right_arrow~%.0f~degrees~" % (temperature, target)
+        return "%3.0f~degrees~" % (temperature,)
+    def format_percent(self, width, value, align='^'):
+        return '{:{}{}.0%}'.format(value, align, width)
+    def format_time(self, seconds):
         seconds = int(seconds)
-        self.lcd_chip.write_text(x, y, "%02d:%02d" % (
-            seconds // (60 * 60), (seconds // 60) % 60))
-    def draw_status(self, x, y, gcode_info, toolhead_info):
+        return "%02d:%02d" % (seconds // (60 * 60), (seconds // 60) % 60)
+    def get_status_text(self, gcode_info, toolhead_info):
         # If there is a message set by M117, display it instead of toolhead info
         if self.message:
-            self.lcd_chip.write_text(x, y, self.message)
+            message = self.message
             if self.msg_time:
                 # Screen updates every .5 seconds
                 self.msg_time -= .5
                 if self.msg_time <= 0.:
                     self.message = None
                     self.msg_time = None
-            return
+            return message
         status = toolhead_info['status']
         if status == 'Printing' or gcode_info['busy']:
             pos = self.toolhead.get_position()
             status = "X%-4.0fY%-4.0fZ%-5.2f" % (pos[0], pos[1], pos[2])
-        self.lcd_chip.write_text(x, y, status)
+        return status
     def set_message(self, msg, msg_time=None):
         self.message = msg
         self.msg_time = msg_time
@@ -0,0 +1,28 @@
+# Helper code for sending framebuffer changes to LCD displays
+#
+# Copyright (C) 2018-2019  Kevin O'Connor <kevin@koconnor.net>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+
+# Changes separated by fewer than MERGE_GAP unchanged bytes are sent
+# together as that costs less than the overhead of another transfer
+MERGE_GAP = 16
+MAX_XFER = 32
+
+# Return the [pos, count] ranges that differ between two framebuffers.
+# Ranges are never merged across 'split_pos' (if provided).
+def find_changes(new_data, old_data, split_pos=None):
+    # Find the position of all changed bytes in this framebuffer
+    diffs = [[i, 1] for i, (n, o) in enumerate(zip(new_data, old_data))
+             if n != o]
+    # Batch together changes that are close to each other
+    for i in range(len(diffs)-2, -1, -1):
+        pos, count = diffs[i]
+        nextpos, nextcount = diffs[i+1]
+        if (pos + MERGE_GAP >= nextpos
+            and nextpos + nextcount - pos <= MAX_XFER
+            and (split_pos is None or pos >= split_pos
+                 or nextpos + nextcount <= split_pos)):
+            diffs[i][1] = nextcount + (nextpos - pos)
+            del diffs[i+1]
+    return diffs
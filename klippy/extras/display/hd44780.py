@@ -5,6 +5,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging
+import framebuffer
 
 BACKGROUND_PRIORITY_CLOCK = 0x7fffffff00000000
 
@@ -58,16 +59,11 @@ class HD44780:
         for new_data, old_data, fb_id in self.all_framebuffers:
             if new_data == old_data:
                 continue
-            # Find the position of all changed bytes in this framebuffer
-            diffs = [[i, 1] for i, (n, o) in enumerate(zip(new_data, old_data))
-                     if n != o]
-            # Batch together changes that are close to each other
-            for i in range(len(diffs)-2, -1, -1):
-                pos, count = diffs[i]
-                nextpos, nextcount = diffs[i+1]
-                if pos + 4 >= nextpos and nextcount < 16:
-                    diffs[i][1] = nextcount + (nextpos - pos)
-                    del diffs[i+1]
+            split_pos = None
+            if fb_id == 0x80:
+                # Don't merge across the line 2 DDRAM boundary
+                split_pos = 40
+            diffs = framebuffer.find_changes(new_data, old_data, split_pos)
             # Transmit changes
             for pos, count in diffs:
                 chip_pos = pos
@@ -105,6 +101,8 @@ class HD44780:
         return 0
     def clear(self):
         self.text_framebuffer[:] = ' '*80
+    def clear_area(self, x, y, width):
+        self.write_text(x, y, ' '*max(0, width))
     def get_dimensions(self):
         return (20, 4)
 
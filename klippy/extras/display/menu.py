@@ -12,6 +12,35 @@ class error(Exception):
     pass
 
 
+# Parameter value types that may be used to cache item formatting
+CACHEABLE_TYPES = (int, long, float, str, unicode, bool, type(None))
+
+
+# Printer object parameters - evaluated on first access
+class MenuParameters(dict):
+    def __init__(self, manager, eventtime):
+        dict.__init__(self)
+        self._manager = manager
+        self._eventtime = eventtime
+
+    def __missing__(self, name):
+        if name not in self._manager.objs:
+            raise KeyError(name)
+        self[name] = res = self._manager.lookup_parameters(
+            name, self._eventtime)
+        return res
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def load_all(self):
+        for name in self._manager.objs.keys():
+            self.get(name)
+
+
 # static class for cursor
 class MenuCursor:
     NONE = ' '
@@ -27,8 +56,8 @@ class MenuElement(object):
         self._manager = manager
         self._width = self._asint(config.get('width', '0'))
         self._scroll = self._asbool(config.get('scroll', 'false'))
-        self._enable = self._aslist(config.get('enable', 'true'),
-                                    flatten=False)
+        self._enable = self._compile_bool(
+            self._aslist(config.get('enable', 'true'), flatten=False))
         self._name = self._asliteral(config.get('name'))
         self.__scroll_offs = 0
         self.__scroll_diff = 0
@@ -119,38 +148,46 @@ class MenuElement(object):
             self.__clear_scroll()
         return s
 
-    def _parse_bool(self, lst):
+    def _compile_bool(self, lst):
+        # Convert to a list of lines of (negate, lookup) terms
         try:
-            return any([
-                all([
-                    self._lookup_bool(l2) for l2 in self._words_aslist(l1)
-                ]) for l1 in lst
-            ])
+            return [[self._compile_bool_term(l2)
+                     for l2 in self._words_aslist(l1)] for l1 in lst]
         except Exception:
             logging.exception("Boolean parsing error")
-            return False
+            return []
 
-    def _lookup_bool(self, b):
-        if not self._asbool(b):
-            if b[0] == '!':  # logical negation:
-                return not (not not self._lookup_parameter(b[1:]))
-            else:
-                return not not self._lookup_parameter(b)
-        return True
+    def _compile_bool_term(self, b):
+        if self._asbool(b):
+            return (False, None)
+        if b[0] == '!':  # logical negation:
+            return (True, self._compile_parameter(b[1:]))
+        return (False, self._compile_parameter(b))
+
+    def _parse_bool(self, lines):
+        try:
+            return any(all(lookup is None or (not lookup()) == negate
+                           for negate, lookup in terms) for terms in lines)
+        except Exception:
+            logging.exception("Boolean parsing error")
+            return False
 
-    def _lookup_parameter(self, literal):
+    def _compile_parameter(self, literal):
+        # Return a function that looks up the given parameter
         if self._isfloat(literal):
-            return float(literal)
-        else:
-            # only 2 level dot notation
-            keys = literal.rsplit('.', 1)
-            name = keys[0] if keys[0:1] else None
-            attr = keys[1] if keys[1:2] else None
-            if isinstance(self._manager.parameters, dict):
-                return (self._manager.parameters.get(name) or {}).get(attr)
-            else:
-                logging.error("Parameter storage is not dictionary")
-        return None
+            value = float(literal)
+            return (lambda: value)
+        # only 2 level dot notation
+        keys = literal.rsplit('.', 1)
+        name = keys[0] if keys[0:1] else None
+        attr = keys[1] if keys[1:2] else None
+        manager = self._manager
+        def lookup():
+            if isinstance(manager.parameters, dict):
+                return (manager.parameters.get(name) or {}).get(attr)
+            logging.error("Parameter storage is not dictionary")
+            return None
+        return lookup
 
     def _asliteral(self, s):
         s = str(s).strip()
@@ -328,6 +365,11 @@ class MenuItem(MenuElement):
         super(MenuItem, self).__init__(manager, config, namespace)
         self.parameter = config.get('parameter', '')
         self.transform = config.get('transform', '')
+        # Parse parameters and transforms once at load time
+        self._parameters = [(p, self._compile_parameter(p))
+                            for p in self._words_aslist(self.parameter)]
+        self._transforms = self._transform_aslist()
+        self._format_cache = {}
 
     def _parse_transform(self, t):
         flist = {
@@ -439,33 +481,48 @@ class MenuItem(MenuElement):
                 self.transform, flatten=False)
         )))
 
-    def _parameter_aslist(self):
+    def _parameter_aslist(self, value=None):
         lst = []
-        for p in self._words_aslist(self.parameter):
-            lst.append(self._lookup_parameter(p))
+        for p, lookup in self._parameters:
+            lst.append(lookup())
             if lst[-1] is None:
                 logging.error("Parameter '%s' not found" % str(p))
-        return list(lst)
+        if lst and value is not None:
+            lst[0] = value
+        return lst
 
-    def _prepare_values(self, value=None):
-        values = []
-        for i, v in enumerate(self._parameter_aslist()):
-            values += [value if i == 0 and value is not None else v]
+    def _transform_values(self, values):
+        values = list(values)
         if values:
             try:
-                values += [t(list(values)) for t in self._transform_aslist()]
+                values += [t(list(values)) for t in self._transforms]
             except Exception:
                 logging.exception("Transformation execution failed")
         return tuple(values)
 
+    def _prepare_values(self, value=None):
+        return self._transform_values(self._parameter_aslist(value))
+
     def _get_formatted(self, literal, val=None):
-        values = self._prepare_values(val)
-        if isinstance(literal, str) and len(values) > 0:
-            try:
-                literal = literal.format(*values)
-            except Exception:
-                logging.exception("Literal formatting failed")
-        return literal
+        params = self._parameter_aslist(val)
+        if not isinstance(literal, str) or not params:
+            return literal
+        # Reuse the last result if the (immutable) parameters are unchanged
+        # (types are compared too, as 1 == 1.0 == True format differently)
+        is_cacheable = all(isinstance(p, CACHEABLE_TYPES) for p in params)
+        key = [(type(p), p) for p in params]
+        cache = self._format_cache.get(literal)
+        if is_cacheable and cache is not None and cache[0] == key:
+            return cache[1]
+        values = self._transform_values(params)
+        try:
+            result = literal.format(*values)
+        except Exception:
+            logging.exception("Literal formatting failed")
+            result = literal
+        if is_cacheable:
+            self._format_cache[literal] = (key, result)
+        return result
 
     def _render(self):
         return self._get_formatted(self._name)
@@ -500,8 +557,8 @@ class MenuInput(MenuCommand):
         super(MenuInput, self).__init__(manager, config, namespace)
         self._reverse = self._asbool(config.get('reverse', 'false'))
         self._realtime = self._asbool(config.get('realtime', 'false'))
-        self._readonly = self._aslist(
-            config.get('readonly', 'false'), flatten=False)
+        self._readonly = self._compile_bool(self._aslist(
+            config.get('readonly', 'false'), flatten=False))
         self._input_value = None
         self.__last_value = None
         self._input_min = config.getfloat('input_min', sys.float_info.min)
@@ -1240,44 +1297,43 @@ class MenuManager:
         }
 
     def update_parameters(self, eventtime):
-        self.parameters = {}
-        objs = dict(self.objs)
+        # Parameters are looked up on first use during this update
+        self.parameters = MenuParameters(self, eventtime)
+
+    def lookup_parameters(self, name, eventtime):
+        obj = self.objs.get(name)
         # getting info this way is more like hack
         # all modules should have special reporting method (maybe get_status)
         # for available parameters
         # Only 2 level dot notation
-        for name in objs.keys():
-            try:
-                if objs[name] is not None:
-                    class_name = str(objs[name].__class__.__name__)
-                    get_status = getattr(objs[name], "get_status", None)
-                    if callable(get_status):
-                        self.parameters[name] = get_status(eventtime)
-                    else:
-                        self.parameters[name] = {}
-
-                    self.parameters[name].update({'is_enabled': True})
-                    # get additional info
-                    if class_name == 'ToolHead':
-                        pos = objs[name].get_position()
-                        self.parameters[name].update({
-                            'xpos': pos[0],
-                            'ypos': pos[1],
-                            'zpos': pos[2],
-                            'epos': pos[3]
-                        })
-                        self.parameters[name].update({
-                            'is_printing': (
-                                self.parameters[name]['status'] == "Printing"),
-                            'is_ready': (
-                                self.parameters[name]['status'] == "Ready"),
-                            'is_idle': (
-                                self.parameters[name]['status'] == "Idle")
-                        })
-                else:
-                    self.parameters[name] = {'is_enabled': False}
-            except Exception:
-                logging.exception("Parameter '%s' update error" % str(name))
+        try:
+            if obj is None:
+                return {'is_enabled': False}
+            class_name = str(obj.__class__.__name__)
+            get_status = getattr(obj, "get_status", None)
+            if callable(get_status):
+                params = get_status(eventtime)
+            else:
+                params = {}
+            params.update({'is_enabled': True})
+            # get additional info
+            if class_name == 'ToolHead':
+                pos = obj.get_position()
+                params.update({
+                    'xpos': pos[0],
+                    'ypos': pos[1],
+                    'zpos': pos[2],
+                    'epos': pos[3]
+                })
+                params.update({
+                    'is_printing': (params['status'] == "Printing"),
+                    'is_ready': (params['status'] == "Ready"),
+                    'is_idle': (params['status'] == "Idle")
+                })
+            return params
+        except Exception:
+            logging.exception("Parameter '%s' update error" % str(name))
+            return None
 
     def stack_push(self, container):
         if not isinstance(container, MenuContainer):
@@ -1577,6 +1633,8 @@ class MenuManager:
     cmd_DO_help = "Menu do things"
 
     def cmd_DO_DUMP(self, params):
+        if isinstance(self.parameters, MenuParameters):
+            self.parameters.load_all()
         for key1 in self.parameters:
             if type(self.parameters[key1]) == dict:
                 for key2 in self.parameters[key1]:
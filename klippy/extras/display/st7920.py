@@ -4,7 +4,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging
-import icons, font8x14
+import icons, font8x14, framebuffer
 
 BACKGROUND_PRIORITY_CLOCK = 0x7fffffff00000000
 
@@ -75,16 +75,7 @@ class ST7920:
         for new_data, old_data, fb_id in self.all_framebuffers:
             if new_data == old_data:
                 continue
-            # Find the position of all changed bytes in this framebuffer
-            diffs = [[i, 1] for i, (n, o) in enumerate(zip(new_data, old_data))
-                     if n != o]
-            # Batch together changes that are close to each other
-            for i in range(len(diffs)-2, -1, -1):
-                pos, count = diffs[i]
-                nextpos, nextcount = diffs[i+1]
-                if pos + 5 >= nextpos and nextcount < 16:
-                    diffs[i][1] = nextcount + (nextpos - pos)
-                    del diffs[i+1]
+            diffs = framebuffer.find_changes(new_data, old_data)
             # Transmit changes
             for pos, count in diffs:
                 count += pos & 0x01
@@ -164,5 +155,11 @@ class ST7920:
         zeros = bytearray(32)
         for gfb in self.graphics_framebuffers:
             gfb[:] = zeros
+    def clear_area(self, x, y, width):
+        width = max(0, min(x + width, 16) - x)
+        self.write_text(x, y, ' '*width)
+        zeros = bytearray(width)
+        for row in range(16):
+            self.write_graphics(x, y, row, zeros)
     def get_dimensions(self):
         return (16, 4)
@@ -6,7 +6,7 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging
-import icons, font8x14, extras.bus
+import icons, font8x14, framebuffer, extras.bus
 
 BACKGROUND_PRIORITY_CLOCK = 0x7fffffff00000000
 
@@ -32,16 +32,7 @@ class DisplayBase:
         for new_data, old_data, page in self.all_framebuffers:
             if new_data == old_data:
                 continue
-            # Find the position of all changed bytes in this framebuffer
-            diffs = [[i, 1] for i, (n, o) in enumerate(zip(new_data, old_data))
-                     if n != o]
-            # Batch together changes that are close to each other
-            for i in range(len(diffs)-2, -1, -1):
-                pos, count = diffs[i]
-                nextpos, nextcount = diffs[i+1]
-                if pos + 5 >= nextpos and nextcount < 16:
-                    diffs[i][1] = nextcount + (nextpos - pos)
-                    del diffs[i+1]
+            diffs = framebuffer.find_changes(new_data, old_data)
             # Transmit changes
             for col_pos, count in diffs:
                 # Set Position registers
@@ -102,6 +93,12 @@ class DisplayBase:
         zeros = bytearray(128)
         for page in self.vram:
             page[:] = zeros
+    def clear_area(self, x, y, width):
+        pix_x = x * 8
+        pix_end = max(pix_x, min(x + width, 16) * 8)
+        zeros = bytearray(pix_end - pix_x)
+        self.vram[y * 2][pix_x:pix_end] = zeros
+        self.vram[y * 2 + 1][pix_x:pix_end] = zeros
     def get_dimensions(self):
         return (16, 4)
 
@@ -52,7 +52,7 @@ class GCodeButton:
         while self.template_queue:
             template = self.template_queue[0]
             try:
-                self.gcode.run_script(template.render())
+                self.gcode.run_script(template.render(eventtime=eventtime))
             except Exception:
                 logging.exception("Script running error")
             self.template_queue.pop(0)
@@ -3,7 +3,7 @@
 # Copyright (C) 2018-2019  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import traceback, logging, ast
+import traceback, logging, ast, hashlib, os
 import jinja2
 
 
@@ -11,23 +11,39 @@ import jinja2
 # Template handling
 ######################################################################
 
+# Cache of printer object get_status() results for a given eventtime
+class StatusSnapshot:
+    def __init__(self, gcode_macro, eventtime):
+        self.gcode_macro = gcode_macro
+        self.printer = gcode_macro.printer
+        self.eventtime = eventtime
+        self.cache = {}
+    def get_status(self, name):
+        if name in self.cache:
+            return self.cache[name]
+        po = self.printer.lookup_object(name, None)
+        if po is None or not hasattr(po, 'get_status'):
+            raise KeyError(name)
+        self.gcode_macro.status_calls += 1
+        self.cache[name] = res = dict(po.get_status(self.eventtime))
+        return res
+    def get_names(self):
+        return [name for name, po in self.printer.lookup_objects()
+                if hasattr(po, 'get_status')]
+
 # Wrapper for access to printer object get_status() methods
 class GetStatusWrapper:
     def __init__(self, printer, eventtime=None):
         self.printer = printer
         self.eventtime = eventtime
-        self.cache = {}
+        self.snapshot = None
+    def _get_snapshot(self):
+        if self.snapshot is None:
+            gcode_macro = self.printer.lookup_object('gcode_macro')
+            self.snapshot = gcode_macro.get_status_snapshot(self.eventtime)
+        return self.snapshot
     def __getitem__(self, val):
-        sval = str(val).strip()
-        if sval in self.cache:
-            return self.cache[sval]
-        po = self.printer.lookup_object(sval, None)
-        if po is None or not hasattr(po, 'get_status'):
-            raise KeyError(val)
-        if self.eventtime is None:
-            self.eventtime = self.printer.get_reactor().monotonic()
-        self.cache[sval] = res = dict(po.get_status(self.eventtime))
-        return res
+        return self._get_snapshot().get_status(str(val).strip())
     def __contains__(self, val):
         try:
             self.__getitem__(val)
@@ -35,9 +51,21 @@ class GetStatusWrapper:
             return False
         return True
     def __iter__(self):
-        for name, obj in self.printer.lookup_objects():
-            if self.__contains__(name):
-                yield name
+        for name in self._get_snapshot().get_names():
+            yield name
+
+# Jinja2 loader that locates template scripts by their source hash
+class TemplateLoader(jinja2.BaseLoader):
+    def __init__(self):
+        self.scripts = {}
+    def add_script(self, script):
+        key = hashlib.sha1(script).hexdigest()
+        self.scripts[key] = script
+        return key
+    def get_source(self, env, key):
+        if key not in self.scripts:
+            raise jinja2.TemplateNotFound(key)
+        return self.scripts[key], None, (lambda: True)
 
 # Wrapper around a Jinja2 template
 class TemplateWrapper:
@@ -45,8 +73,11 @@ class TemplateWrapper:
         self.printer = printer
         self.name = name
         self.gcode = self.printer.lookup_object('gcode')
+        self.reactor = self.printer.get_reactor()
+        self.render_count = 0
+        self.render_time = self.render_max_time = 0.
         try:
-            self.template = env.from_string(script)
+            self.template = env.get_template(env.loader.add_script(script))
         except Exception as e:
             msg = "Error loading template '%s': %s" % (
                  name, traceback.format_exception_only(type(e), e)[-1])
@@ -54,16 +85,27 @@ class TemplateWrapper:
             raise printer.config_error(msg)
     def create_status_wrapper(self, eventtime=None):
         return GetStatusWrapper(self.printer, eventtime)
-    def render(self, context=None):
+    def render(self, context=None, eventtime=None):
         if context is None:
-            context = {'printer': self.create_status_wrapper()}
+            context = {'printer': self.create_status_wrapper(eventtime)}
+        start_time = self.reactor.monotonic()
         try:
-            return str(self.template.render(context))
+            res = str(self.template.render(context))
         except Exception as e:
             msg = "Error evaluating '%s': %s" % (
                 self.name, traceback.format_exception_only(type(e), e)[-1])
             logging.exception(msg)
             raise self.gcode.error(msg)
+        finally:
+            render_time = self.reactor.monotonic() - start_time
+            self.render_count += 1
+            self.render_time += render_time
+            self.render_max_time = max(self.render_max_time, render_time)
+        if res.strip():
+            # The resulting commands may alter the printer state
+            gcode_macro = self.printer.lookup_object('gcode_macro')
+            gcode_macro.reset_status_snapshot()
+        return res
     def run_gcode_from_command(self, context=None):
         self.gcode.run_script_from_command(self.render(context))
 
@@ -71,14 +113,79 @@ class TemplateWrapper:
 class PrinterGCodeMacro:
     def __init__(self, config):
         self.printer = config.get_printer()
-        self.env = jinja2.Environment('{%', '%}', '{', '}')
+        # Optional on-disk cache of compiled templates
+        bytecode_cache = None
+        self.cache_path = config.get('template_cache_path', None)
+        if self.cache_path is not None:
+            self.cache_path = os.path.normpath(
+                os.path.expanduser(self.cache_path))
+            try:
+                if not os.path.isdir(self.cache_path):
+                    os.makedirs(self.cache_path)
+            except OSError as e:
+                raise config.error("Unable to create template cache '%s'" % (
+                    self.cache_path,))
+            if not os.access(self.cache_path, os.W_OK):
+                raise config.error("Unable to write template cache '%s'" % (
+                    self.cache_path,))
+            bytecode_cache = jinja2.FileSystemBytecodeCache(
+                self.cache_path, '%s.klippy_template')
+        self.env = jinja2.Environment(
+            '{%', '%}', '{', '}', loader=TemplateLoader(),
+            bytecode_cache=bytecode_cache)
+        self.templates = []
+        self.load_time = 0.
+        self.snapshot = None
+        self.status_calls = self.snapshot_hits = 0
+        self.gcode = self.printer.lookup_object('gcode')
+        self.gcode.register_command("MACRO_STATS", self.cmd_MACRO_STATS,
+                                    desc=self.cmd_MACRO_STATS_help)
     def load_template(self, config, option, default=None):
         name = "%s:%s" % (config.get_name(), option)
         if default is None:
             script = config.get(option)
         else:
             script = config.get(option, default)
-        return TemplateWrapper(self.printer, self.env, name, script)
+        reactor = self.printer.get_reactor()
+        start_time = reactor.monotonic()
+        template = TemplateWrapper(self.printer, self.env, name, script)
+        self.load_time += reactor.monotonic() - start_time
+        self.templates.append(template)
+        return template
+    # Status snapshots shared between templates rendered at one eventtime
+    def get_status_snapshot(self, eventtime=None):
+        snapshot = self.snapshot
+        if eventtime is not None and snapshot is not None:
+            if snapshot.eventtime == eventtime:
+                self.snapshot_hits += 1
+                return snapshot
+        self.reset_status_snapshot()
+        if eventtime is None:
+            # Status requested from a g-code command - don't share it
+            eventtime = self.printer.get_reactor().monotonic()
+            return StatusSnapshot(self, eventtime)
+        self.snapshot = StatusSnapshot(self, eventtime)
+        return self.snapshot
+    def reset_status_snapshot(self):
+        self.snapshot = None
+    cmd_MACRO_STATS_help = "Report g-code template render statistics"
+    def cmd_MACRO_STATS(self, params):
+        cache = "disabled"
+        if self.cache_path is not None:
+            cache = self.cache_path
+        msg = ["Loaded %d templates in %.3fs (template cache: %s)" % (
+            len(self.templates), self.load_time, cache)]
+        templates = [t for t in self.templates if t.render_count]
+        templates.sort(key=(lambda t: t.render_time), reverse=True)
+        for t in templates:
+            msg.append("%s: renders=%d total=%.3fs avg=%.3fms max=%.3fms" % (
+                t.name, t.render_count, t.render_time,
+                t.render_time * 1000. / t.render_count,
+                t.render_max_time * 1000.))
+        self.gcode.respond_info("\n".join(msg))
+    def stats(self, eventtime):
+        return False, "gcode_macro: status_calls=%d snapshot_hits=%d" % (
+            self.status_calls, self.snapshot_hits)
 
 def load_config(config):
     return PrinterGCodeMacro(config)
@@ -41,7 +41,7 @@ class IdleTimeout:
     def transition_idle_state(self, eventtime):
         self.state = "Printing"
         try:
-            script = self.idle_gcode.render()
+            script = self.idle_gcode.render(eventtime=eventtime)
             res = self.gcode.run_script(script)
         except:
             logging.exception("idle timeout gcode execution")
@@ -3,8 +3,8 @@
 # Copyright (C) 2016-2018  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import math, logging
-import heater
+import math, logging, bisect
+import heater, mathutil
 
 class PIDCalibrate:
     def __init__(self, config):
@@ -18,13 +18,18 @@ class PIDCalibrate:
         heater_name = self.gcode.get_str('HEATER', params)
         target = self.gcode.get_float('TARGET', params)
         write_file = self.gcode.get_int('WRITE_FILE', params, 0)
+        methods = {'relay': ControlAutoTune, 'model': ControlModelTune}
+        method = self.gcode.get_str('METHOD', params, 'relay').lower()
+        if method not in methods:
+            raise self.gcode.error("Unknown calibration method '%s'" % (
+                method,))
         pheater = self.printer.lookup_object('heater')
         try:
             heater = pheater.lookup_heater(heater_name)
         except self.printer.config_error as e:
             raise self.gcode.error(str(e))
         print_time = self.printer.lookup_object('toolhead').get_last_move_time()
-        calibrate = ControlAutoTune(heater, target)
+        calibrate = methods[method](heater, target)
         old_control = heater.set_control(calibrate)
         try:
             heater.set_temp(print_time, target)
@@ -35,13 +40,16 @@ class PIDCalibrate:
         heater.set_control(old_control)
         if write_file:
             calibrate.write_file('/tmp/heattest.txt')
+        if calibrate.check_busy(0., 0., 0.):
+            raise self.gcode.error("pid_calibrate interrupted")
         # Log and report results
         Kp, Ki, Kd = calibrate.calc_final_pid()
         logging.info("Autotune: final: Kp=%f Ki=%f Kd=%f", Kp, Ki, Kd)
         self.gcode.respond_info(
-            "PID parameters: pid_Kp=%.3f pid_Ki=%.3f pid_Kd=%.3f\n"
+            "%sPID parameters: pid_Kp=%.3f pid_Ki=%.3f pid_Kd=%.3f\n"
             "The SAVE_CONFIG command will update the printer config file\n"
-            "with these parameters and restart the printer." % (Kp, Ki, Kd))
+            "with these parameters and restart the printer." % (
+                calibrate.get_report(), Kp, Ki, Kd))
         # Store results for SAVE_CONFIG
         configfile = self.printer.lookup_object('configfile')
         configfile.set(heater_name, 'control', 'pid')
@@ -131,6 +139,8 @@ class ControlAutoTune:
                        for pos in range(4, len(self.peaks))]
         midpoint_pos = sorted(cycle_times)[len(cycle_times)/2][1]
         return self.calc_pid(midpoint_pos)
+    def get_report(self):
+        return ""
     # Offline analysis helper
     def write_file(self, filename):
         pwm = ["pwm: %.3f %.3f" % (time, value)
@@ -140,5 +150,105 @@ class ControlAutoTune:
         f.write('\n'.join(pwm + out))
         f.close()
 
+MODEL_TUNE_PEAKS = 4
+MODEL_MAX_DELAY = 60.
+MODEL_DELAY_POINTS = 8
+MODEL_DELAY_ROUNDS = 4
+
+# Autotune by fitting a first-order-plus-dead-time model
+class ControlModelTune(ControlAutoTune):
+    def __init__(self, heater, target):
+        ControlAutoTune.__init__(self, heater, target)
+        self.model = None
+    def check_busy(self, eventtime, smoothed_temp, target_temp):
+        if self.heating or len(self.peaks) < MODEL_TUNE_PEAKS:
+            return True
+        return False
+    def check_peaks(self):
+        self.peaks.append((self.peak, self.peak_time))
+        if self.heating:
+            self.peak = 9999999.
+        else:
+            self.peak = -9999999.
+    # Model fitting
+    def get_pwm(self, pwm_times, print_time):
+        pos = bisect.bisect(pwm_times, print_time)
+        if not pos:
+            return 0.
+        return self.pwm_samples[pos-1][1]
+    def fit_model(self, delay):
+        # Fit dT/dt = c1*pwm(t - delay) + c2*T + c3 using least squares
+        samples = self.temp_samples
+        pwm_times = [t for t, v in self.pwm_samples]
+        pwms = [self.get_pwm(pwm_times, t - delay) for t, temp in samples]
+        rows = []
+        values = []
+        for i in range(len(samples) - 1):
+            (t1, temp1), (t2, temp2) = samples[i], samples[i+1]
+            rows.append((pwms[i], temp1, 1.))
+            values.append((temp2 - temp1) / (t2 - t1))
+        coefs = mathutil.linear_least_squares(rows, values)
+        if coefs is None or coefs[1] >= 0.:
+            return None
+        c1, c2, c3 = coefs
+        # Simulate the model and compare it to the measurements
+        sim_temp = samples[0][1]
+        total_error = 0.
+        for i in range(len(samples) - 1):
+            t1, t2 = samples[i][0], samples[i+1][0]
+            sim_temp += (t2 - t1) * (c1 * pwms[i] + c2 * sim_temp + c3)
+            total_error += (sim_temp - samples[i+1][1])**2
+        rms_error = math.sqrt(total_error / (len(samples) - 1))
+        tau = -1. / c2
+        return rms_error, c1 * tau, tau, delay
+    def calc_final_pid(self):
+        duration = self.temp_samples[-1][0] - self.temp_samples[0][0]
+        max_delay = min(MODEL_MAX_DELAY, .5 * duration)
+        # Search for the dead time with the best fit - start with a
+        # coarse grid and then repeatedly refine it around the best fit
+        step = max_delay / MODEL_DELAY_POINTS
+        delays = [step * i for i in range(1, MODEL_DELAY_POINTS + 1)]
+        fits = []
+        for i in range(MODEL_DELAY_ROUNDS):
+            fits.extend([f for f in [self.fit_model(d) for d in delays] if f])
+            if not fits:
+                break
+            center = min(fits)[3]
+            step *= 2. / MODEL_DELAY_POINTS
+            delays = [center + step * j
+                      for j in range(-MODEL_DELAY_POINTS // 2,
+                                     MODEL_DELAY_POINTS // 2 + 1)
+                      if j and 0. < center + step * j <= max_delay]
+        if not fits:
+            raise self.heater.printer.command_error(
+                "Unable to fit a heater model")
+        self.model = rms_error, gain, tau, delay = min(fits)
+        logging.info("Autotune: model gain=%f tau=%f delay=%f rms_error=%f",
+                     gain, tau, delay, rms_error)
+        # Find the ultimate gain and period of the model (the frequency
+        # where the phase lag is 180 degrees)
+        low, high = 0., math.pi / delay
+        for i in range(100):
+            w = .5 * (low + high)
+            if math.atan(w * tau) + w * delay < math.pi:
+                low = w
+            else:
+                high = w
+        Ku = math.sqrt(1. + (w * tau)**2) / gain
+        Tu = 2. * math.pi / w
+        # Use Ziegler-Nichols method to generate PID parameters
+        Ti = 0.5 * Tu
+        Td = 0.125 * Tu
+        Kp = 0.6 * Ku * heater.PID_PARAM_BASE
+        Ki = Kp / Ti
+        Kd = Kp * Td
+        logging.info("Autotune: model Ku=%f Tu=%f  Kp=%f Ki=%f Kd=%f",
+                     Ku, Tu, Kp, Ki, Kd)
+        return Kp, Ki, Kd
+    def get_report(self):
+        rms_error, gain, tau, delay = self.model
+        return ("Heater model: gain=%.1f time_constant=%.1fs dead_time=%.1fs"
+                " fit_error=%.3fC (rms)\n" % (gain, tau, delay, rms_error))
+
 def load_config(config):
     return PIDCalibrate(config)
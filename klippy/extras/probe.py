@@ -3,6 +3,7 @@
 # Copyright (C) 2017-2019  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
+import math, logging
 import pins, homing, manual_probe
 
 HINT_TIMEOUT = """
@@ -12,6 +13,10 @@ the Z axis minimum position so the probe can travel further
 (the Z minimum position can be negative).
 """
 
+# Limits on the 2-opt probe path improvement (each pass is O(n^2))
+PATH_OPT_MAX_POINTS = 100
+PATH_OPT_MAX_PASSES = 10
+
 class PrinterProbe:
     def __init__(self, config, mcu_probe):
         self.printer = config.get_printer()
@@ -31,15 +36,22 @@ class PrinterProbe:
             self.z_position = pconfig.getfloat('minimum_z_position', 0.)
         # Multi-sample support (for improved accuracy)
         self.sample_count = config.getint('samples', 1, minval=1)
+        self.samples_max = config.getint('samples_max', self.sample_count,
+                                         minval=self.sample_count)
+        if self.samples_max > self.sample_count and self.sample_count < 3:
+            raise config.error("Adaptive sampling (samples_max) requires"
+                               " samples of at least 3 in %s" % (self.name,))
         self.sample_retract_dist = config.getfloat('sample_retract_dist', 2.,
                                                    above=0.)
-        atypes = {'median': 'median', 'average': 'average'}
+        atypes = {'median': 'median', 'average': 'average',
+                  'trimmed': 'trimmed'}
         self.samples_result = config.getchoice('samples_result', atypes,
                                                'average')
         self.samples_tolerance = config.getfloat('samples_tolerance', 0.100,
                                                  minval=0.)
         self.samples_retries = config.getint('samples_tolerance_retries', 0,
                                              minval=0)
+        self.total_saved_time = 0.
         # Register z_virtual_endstop pin
         self.printer.lookup_object('pins').register_chip('probe', self)
         # Register PROBE/QUERY_PROBE commands
@@ -100,6 +112,13 @@ class PrinterProbe:
             return z_sorted[middle]
         # even number of samples
         return self._calc_mean(z_sorted[middle-1:middle+1])
+    def _get_core_samples(self, positions):
+        # Discard the highest and lowest quarter of the samples
+        z_sorted = sorted(positions, key=(lambda p: p[2]))
+        trim = len(positions) // 4
+        return z_sorted[trim:len(positions)-trim]
+    def _calc_trimmed_mean(self, positions):
+        return self._calc_mean(self._get_core_samples(positions))
     def run_probe(self, params={}):
         speed = self.gcode.get_float(
             "PROBE_SPEED", params, self.speed, above=0.)
@@ -113,15 +132,33 @@ class PrinterProbe:
             "SAMPLES_TOLERANCE_RETRIES", params, self.samples_retries, minval=0)
         samples_result = self.gcode.get_str(
             "SAMPLES_RESULT", params, self.samples_result)
-        retries = 0
+        samples_max = self.gcode.get_int(
+            "SAMPLES_MAX", params, max(self.samples_max, sample_count),
+            minval=sample_count)
+        # With adaptive sampling, probing stops as soon as the samples
+        # (excluding outliers) are within samples_tolerance
+        adaptive = samples_max > sample_count
+        if adaptive and sample_count < 3:
+            raise homing.CommandError(
+                "Adaptive sampling (SAMPLES_MAX) requires SAMPLES >= 3")
+        reactor = self.printer.get_reactor()
+        start_time = reactor.monotonic()
+        retries = probe_count = 0
         positions = []
-        while len(positions) < sample_count:
+        while 1:
             # Probe position
             pos = self._probe(speed)
             positions.append(pos)
+            probe_count += 1
             # Check samples tolerance
-            z_positions = [p[2] for p in positions]
-            if max(z_positions) - min(z_positions) > samples_tolerance:
+            check_positions = positions
+            if adaptive:
+                check_positions = self._get_core_samples(positions)
+            z_positions = [p[2] for p in check_positions]
+            if max(z_positions) - min(z_positions) <= samples_tolerance:
+                if len(positions) >= sample_count:
+                    break
+            elif not adaptive or len(positions) >= samples_max:
                 if retries >= samples_retries:
                     raise homing.CommandError(
                         "Probe samples exceed samples_tolerance")
@@ -130,12 +167,22 @@ class PrinterProbe:
                 retries += 1
                 positions = []
             # Retract
-            if len(positions) < sample_count:
-                liftpos = [None, None, pos[2] + sample_retract_dist]
-                self._move(liftpos, speed)
-        # Calculate and return result
+            liftpos = [None, None, pos[2] + sample_retract_dist]
+            self._move(liftpos, speed)
+        if adaptive:
+            sample_time = (reactor.monotonic() - start_time) / probe_count
+            saved_time = (samples_max - len(positions)) * sample_time
+            self.total_saved_time += saved_time
+            logging.info("probe at %.3f,%.3f used %d of %d samples"
+                         " (saved %.3fs, total saved %.3fs)",
+                         pos[0], pos[1], len(positions), samples_max,
+                         saved_time, self.total_saved_time)
+        # Calculate and return result (an adaptive average only uses the
+        # samples that were checked against samples_tolerance)
         if samples_result == 'median':
             return self._calc_median(positions)
+        if samples_result == 'trimmed' or adaptive:
+            return self._calc_trimmed_mean(positions)
         return self._calc_mean(positions)
     cmd_PROBE_help = "Probe Z-height at current XY position"
     def cmd_PROBE(self, params):
@@ -261,6 +308,46 @@ class ProbeEndstopWrapper:
     def get_position_endstop(self):
         return self.position_endstop
 
+# Return an order to visit points (starting from 'start') that reduces
+# the total XY travel distance
+def calc_probe_path(start, points):
+    def dist(a, b):
+        return math.sqrt((a[0] - b[0])**2 + (a[1] - b[1])**2)
+    # Start with a nearest neighbor path
+    remaining = range(len(points))
+    path = [start]
+    order = []
+    while remaining:
+        idx = min(remaining, key=lambda i: dist(path[-1], points[i]))
+        remaining.remove(idx)
+        path.append(points[idx])
+        order.append(idx)
+    if len(points) > PATH_OPT_MAX_POINTS:
+        return order
+    # Improve it by reversing sections of the path (2-opt)
+    for opt_pass in range(PATH_OPT_MAX_PASSES):
+        improved = False
+        for i in range(1, len(path) - 1):
+            for j in range(i + 1, len(path)):
+                a, b, c = path[i-1], path[i], path[j]
+                gain = dist(a, b) - dist(a, c)
+                if j + 1 < len(path):
+                    d = path[j+1]
+                    gain += dist(c, d) - dist(b, d)
+                if gain > .000001:
+                    path[i:j+1] = reversed(path[i:j+1])
+                    order[i-1:j] = reversed(order[i-1:j])
+                    improved = True
+        if not improved:
+            break
+    return order
+
+def calc_path_distance(start, points):
+    dist = 0.
+    for a, b in zip([start] + points[:-1], points):
+        dist += math.sqrt((a[0] - b[0])**2 + (a[1] - b[1])**2)
+    return dist
+
 # Helper code that can probe a series of points and report the
 # position at each point.
 class ProbePointsHelper:
@@ -282,9 +369,11 @@ class ProbePointsHelper:
                     self.name))
         self.horizontal_move_z = config.getfloat('horizontal_move_z', 5.)
         self.speed = config.getfloat('speed', 50., above=0.)
+        self.optimize_path = config.getboolean('optimize_path', False)
         # Internal probing state
         self.lift_speed = self.speed
         self.probe_offsets = (0., 0., 0.)
+        self.probe_order = range(len(self.probe_points))
         self.results = []
     def minimum_points(self,n):
         if len(self.probe_points) < n:
@@ -306,21 +395,43 @@ class ProbePointsHelper:
         if len(self.results) >= len(self.probe_points):
             self.gcode.reset_last_position()
             toolhead.get_last_move_time()
-            res = self.finalize_callback(self.probe_offsets, self.results)
+            # Report results in the configured order
+            results = [None] * len(self.results)
+            for idx, pos in zip(self.probe_order, self.results):
+                results[idx] = pos
+            res = self.finalize_callback(self.probe_offsets, results)
             if res != "retry":
                 return True
             self.results = []
         # Move to next XY probe point
-        curpos[:2] = self.probe_points[len(self.results)]
+        curpos[:2] = self.probe_points[self.probe_order[len(self.results)]]
         toolhead.move(curpos, self.speed)
         self.gcode.reset_last_position()
         return False
+    def _plan_path(self):
+        self.probe_order = range(len(self.probe_points))
+        if not self.optimize_path:
+            return
+        toolhead = self.printer.lookup_object('toolhead')
+        start = toolhead.get_position()[:2]
+        order = calc_probe_path(start, self.probe_points)
+        orig_dist = calc_path_distance(start, self.probe_points)
+        new_dist = calc_path_distance(
+            start, [self.probe_points[i] for i in order])
+        if new_dist >= orig_dist:
+            return
+        self.probe_order = order
+        self.gcode.respond_info(
+            "Probe path travel reduced from %.1fmm to %.1fmm"
+            " (estimated %.1fs saved)" % (
+                orig_dist, new_dist, (orig_dist - new_dist) / self.speed))
     def start_probe(self, params):
         manual_probe.verify_no_manual_probe(self.printer)
         # Lookup objects
         probe = self.printer.lookup_object('probe', None)
         method = self.gcode.get_str('METHOD', params, 'automatic').lower()
         self.results = []
+        self._plan_path()
         if probe is None or method != 'automatic':
             # Manual probe
             self.lift_speed = self.speed
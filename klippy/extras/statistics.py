@@ -3,7 +3,77 @@
 # Copyright (C) 2018  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging
+import os, struct, logging, threading, Queue
+
+# Binary stats log format (see scripts/graphstats.py for the reader):
+#   file header: STATS_LOG_MAGIC
+#   schema: 'S' <uint32 length> <space separated column names>
+#   record: 'R' <double eventtime> <double value>*ncolumns
+# A schema is written whenever the set of reported fields changes and
+# applies to all records that follow it.  Column names are the stats
+# field names with their source prefix (eg, "mcu:bytes_write") and
+# non-numeric values are stored as NaN.
+STATS_LOG_MAGIC = "KLIPPYSTATS 1\n"
+
+class StatsLog:
+    def __init__(self, filename):
+        self.file = open(filename, 'ab')
+        self.file.seek(0, os.SEEK_END)
+        if not self.file.tell():
+            self.file.write(STATS_LOG_MAGIC)
+        self.columns = None
+        self.record = None
+        # Records are written from a background thread so that a slow
+        # disk can not stall the reactor
+        self.is_error = False
+        self.bg_queue = Queue.Queue()
+        self.bg_thread = threading.Thread(target=self._bg_thread)
+        self.bg_thread.daemon = True
+        self.bg_thread.start()
+    def _bg_thread(self):
+        while 1:
+            data = self.bg_queue.get(True)
+            if data is None:
+                break
+            if self.is_error:
+                continue
+            try:
+                self.file.write(data)
+                if self.bg_queue.empty():
+                    self.file.flush()
+            except IOError:
+                logging.exception("Unable to write stats_log")
+                self.is_error = True
+        self.file.close()
+    def _write_schema(self, columns):
+        self.columns = columns
+        schema = ' '.join(columns)
+        self.bg_queue.put_nowait(
+            'S' + struct.pack('<I', len(schema)) + schema)
+        self.record = struct.Struct('<cd%dd' % (len(columns),))
+    def write(self, eventtime, stats):
+        if self.is_error:
+            return
+        columns = []
+        values = []
+        for is_active, msg in stats:
+            prefix = ''
+            for part in msg.split():
+                if '=' not in part:
+                    prefix = part
+                    continue
+                name, val = part.split('=', 1)
+                columns.append(prefix + name)
+                try:
+                    values.append(float(val))
+                except ValueError:
+                    values.append(float('nan'))
+        if columns != self.columns:
+            self._write_schema(columns)
+        self.bg_queue.put_nowait(self.record.pack('R', eventtime, *values))
+    def close(self):
+        self.bg_queue.put_nowait(None)
+        self.bg_thread.join()
 
 class PrinterStats:
     def __init__(self, config):
@@ -11,18 +81,35 @@ class PrinterStats:
         reactor = self.printer.get_reactor()
         self.stats_timer = reactor.register_timer(self.generate_stats)
         self.stats_cb = []
+        self.stats_log = None
+        stats_log = config.get('stats_log', None)
+        if stats_log is not None:
+            stats_log = os.path.expanduser(stats_log)
+            try:
+                self.stats_log = StatsLog(stats_log)
+            except IOError as e:
+                raise config.error("Unable to open stats_log '%s': %s" % (
+                    stats_log, str(e)))
         self.printer.register_event_handler("klippy:ready", self.handle_ready)
+        self.printer.register_event_handler("klippy:disconnect",
+                                            self.handle_disconnect)
     def handle_ready(self):
         self.stats_cb = [o.stats for n, o in self.printer.lookup_objects()
                          if hasattr(o, 'stats')]
         if self.printer.get_start_args().get('debugoutput') is None:
             reactor = self.printer.get_reactor()
             reactor.update_timer(self.stats_timer, reactor.NOW)
+    def handle_disconnect(self):
+        if self.stats_log is not None:
+            self.stats_log.close()
+            self.stats_log = None
     def generate_stats(self, eventtime):
         stats = [cb(eventtime) for cb in self.stats_cb]
         if max([s[0] for s in stats]):
             logging.info("Stats %.1f: %s", eventtime,
                          ' '.join([s[1] for s in stats]))
+            if self.stats_log is not None:
+                self.stats_log.write(eventtime, stats)
         return eventtime + 1.
 
 def load_config(config):
@@ -21,7 +21,9 @@ class TemperatureFan:
         self.sensor = self.printer.lookup_object('heater').setup_sensor(config)
         self.sensor.setup_minmax(self.min_temp, self.max_temp)
         self.sensor.setup_callback(self.temperature_callback)
-        self.printer.lookup_object('heater').register_sensor(config, self)
+        pheaters = self.printer.lookup_object('heater')
+        pheaters.register_sensor(config, self)
+        self.history = pheaters.setup_history(config)
         self.speed_delay = self.sensor.get_report_time_delta()
         self.max_speed = config.getfloat('max_speed', 1., above=0., maxval=1.)
         self.min_speed = config.getfloat('min_speed', 0.3, minval=0., maxval=1.)
@@ -59,6 +61,8 @@ class TemperatureFan:
     def temperature_callback(self, read_time, temp):
         self.last_temp = temp
         self.control.temperature_callback(read_time, temp)
+        self.history.add(read_time, temp, self.target_temp,
+                         self.last_speed_value)
     def get_temp(self, eventtime):
         return self.last_temp, self.target_temp
     def get_min_speed(self):
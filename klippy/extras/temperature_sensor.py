@@ -16,10 +16,13 @@ class PrinterSensorGeneric:
                                         above=self.min_temp)
         self.sensor.setup_minmax(self.min_temp, self.max_temp)
         self.sensor.setup_callback(self.temperature_callback)
-        self.printer.lookup_object('heater').register_sensor(config, self)
+        pheaters = self.printer.lookup_object('heater')
+        pheaters.register_sensor(config, self)
+        self.history = pheaters.setup_history(config)
         self.last_temp = 0.
     def temperature_callback(self, read_time, temp):
         self.last_temp = temp
+        self.history.add(read_time, temp, 0., 0.)
     def get_temp(self, eventtime):
         return self.last_temp, 0.
 
@@ -0,0 +1,80 @@
+# Record a timeline of motion pipeline events (Chrome trace format)
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import os, collections, json, logging
+
+# Events are stored as (phase, category, name, start, end, args) tuples
+# in a fixed size ring buffer.  The DUMP_TRACE command writes them out
+# in the Chrome trace-event format (viewable with chrome://tracing or
+# https://ui.perfetto.dev/).  Each category is shown as its own track.
+
+class TraceRecorder:
+    def __init__(self, config):
+        self.printer = config.get_printer()
+        self.reactor = self.printer.get_reactor()
+        self.now = self.reactor.monotonic
+        buffer_size = config.getint('buffer_size', 100000, minval=100)
+        self.events = collections.deque(maxlen=buffer_size)
+        self.filename = os.path.expanduser(
+            config.get('filename', '/tmp/klippy_trace.json'))
+        self.printer.register_event_handler("klippy:connect",
+                                            self.handle_connect)
+        self.gcode = self.printer.lookup_object('gcode')
+        self.gcode.register_command("DUMP_TRACE", self.cmd_DUMP_TRACE,
+                                    when_not_ready=True,
+                                    desc=self.cmd_DUMP_TRACE_help)
+    def handle_connect(self):
+        self.gcode.set_trace(self)
+        self.printer.lookup_object('toolhead').set_trace(self)
+        for n, m in self.printer.lookup_objects(module='mcu'):
+            m.set_trace(self)
+    # Event recording
+    def add_span(self, category, name, start, args=None):
+        self.events.append(('X', category, name, start, self.now(), args))
+    def add_instant(self, category, name, args=None):
+        self.events.append(('i', category, name, self.now(), None, args))
+    def add_counter(self, category, name, values):
+        self.events.append(('C', category, name, self.now(), None, values))
+    # Export
+    def get_trace(self):
+        events = list(self.events)
+        tids = {}
+        out = []
+        for phase, category, name, start, end, args in events:
+            tid = tids.get(category)
+            if tid is None:
+                tid = tids[category] = len(tids) + 1
+                out.append({'name': 'thread_name', 'ph': 'M', 'pid': 1,
+                            'tid': tid, 'args': {'name': category}})
+            event = {'name': name, 'cat': category, 'ph': phase,
+                     'ts': start * 1000000., 'pid': 1, 'tid': tid}
+            if end is not None:
+                event['dur'] = (end - start) * 1000000.
+            elif phase == 'i':
+                event['s'] = 't'
+            if args is not None:
+                event['args'] = args
+            out.append(event)
+        out.append({'name': 'process_name', 'ph': 'M', 'pid': 1,
+                    'args': {'name': 'klippy'}})
+        return {'traceEvents': out, 'displayTimeUnit': 'ms'}, len(events)
+    cmd_DUMP_TRACE_help = "Write the recorded trace events to a file"
+    def cmd_DUMP_TRACE(self, params):
+        filename = os.path.expanduser(
+            self.gcode.get_str('FILENAME', params, self.filename))
+        trace, count = self.get_trace()
+        try:
+            f = open(filename, 'wb')
+            json.dump(trace, f, separators=(',', ':'))
+            f.close()
+        except (IOError, OSError) as e:
+            logging.exception("Unable to write trace file")
+            raise self.gcode.error("Unable to write trace file '%s': %s" % (
+                filename, str(e)))
+        self.gcode.respond_info("Wrote %d trace events to %s" % (
+            count, filename))
+
+def load_config(config):
+    return TraceRecorder(config)
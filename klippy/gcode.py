@@ -3,13 +3,17 @@
 # Copyright (C) 2016-2019  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import os, re, logging, collections, shlex
+import os, re, logging, collections, shlex, errno
 import homing, kinematics.extruder
 
 # Parse and handle G-Code commands
 class GCodeParser:
     error = homing.CommandError
     RETRY_TIME = 0.100
+    OUTPUT_BUFFER_MAX = 64 * 1024
+    OUTPUT_DROP_MAX = 4 * OUTPUT_BUFFER_MAX
+    PENDING_MIN = 20
+    PENDING_MAX = 300
     def __init__(self, printer, fd):
         self.printer = printer
         self.fd = fd
@@ -23,12 +27,21 @@ class GCodeParser:
         self.is_fileinput = not not printer.get_start_args().get("debuginput")
         self.fd_handle = None
         if not self.is_fileinput:
-            self.fd_handle = self.reactor.register_fd(self.fd,
-                                                      self._process_data)
+            self.fd_handle = self.reactor.register_fd(
+                self.fd, self._process_data, self._flush_output)
+        self.is_input_paused = False
         self.partial_input = ""
         self.pending_commands = []
         self.bytes_read = 0
+        self.input_throttle_count = 0
         self.input_log = collections.deque([], 50)
+        self.trace = None
+        # Output handling
+        self.output_buffer = []
+        self.output_size = 0
+        self.is_output_waiting = self.is_output_overflow = False
+        self.flush_timer = self.reactor.register_timer(self._flush_output)
+        self.bytes_written = self.write_calls = self.bytes_dropped = 0
         # Command handling
         self.is_printer_ready = False
         self.mutex = self.reactor.mutex()
@@ -103,8 +116,14 @@ class GCodeParser:
         self.move_with_transform = transform.move
         self.position_with_transform = transform.get_position
         return old_transform
+    def set_trace(self, trace):
+        self.trace = trace
     def stats(self, eventtime):
-        return False, "gcodein=%d" % (self.bytes_read,)
+        return False, ("gcodein=%d gcodethrottle=%d gcodeout=%d"
+                       " gcodewrites=%d gcodedrop=%d" % (
+                           self.bytes_read, self.input_throttle_count,
+                           self.bytes_written, self.write_calls,
+                           self.bytes_dropped))
     def _action_emergency_stop(self, msg="action_emergency_stop"):
         self.printer.invoke_shutdown("Shutdown due to %s" % (msg,))
         return ""
@@ -162,6 +181,7 @@ class GCodeParser:
         self._respond_state("Shutdown")
     def _handle_disconnect(self):
         self._respond_state("Disconnect")
+        self._flush_output(self.reactor.monotonic())
     def _handle_ready(self):
         self.is_printer_ready = True
         self.gcode_handlers = self.ready_gcode_handlers
@@ -177,8 +197,8 @@ class GCodeParser:
             self.toolhead.set_extruder(self.extruder)
         self.fan = self.printer.lookup_object('fan', None)
         if self.is_fileinput and self.fd_handle is None:
-            self.fd_handle = self.reactor.register_fd(self.fd,
-                                                      self._process_data)
+            self.fd_handle = self.reactor.register_fd(
+                self.fd, self._process_data, self._flush_output)
         self._respond_state("Ready")
     def reset_last_position(self):
         self.last_position = self.position_with_transform()
@@ -236,6 +256,23 @@ class GCodeParser:
                     raise
             self.ack()
     m112_r = re.compile('^(?:[nN][0-9]+)?\s*[mM]112(?:\s|$)')
+    m112_any_r = re.compile('[mM]112')
+    def _check_input_throttle(self, eventtime):
+        # Only read ahead while the toolhead is executing moves and can
+        # accept more of them.  If the toolhead is idle then the current
+        # command is blocking on something else (eg, M109 or M190).
+        pending = len(self.pending_commands)
+        if pending >= self.PENDING_MAX:
+            return True
+        if pending < self.PENDING_MIN:
+            return False
+        if self.toolhead is None:
+            return True
+        print_time, est_print_time, lookahead_empty = self.toolhead.check_busy(
+            eventtime)
+        if print_time <= est_print_time:
+            return True
+        return self.toolhead.is_buffer_full(eventtime)
     def _process_data(self, eventtime):
         # Read input, separate by newline, and add to pending_commands
         try:
@@ -246,6 +283,7 @@ class GCodeParser:
         self.input_log.append((eventtime, data))
         self.bytes_read += len(data)
         lines = data.split('\n')
+        has_partial = not not self.partial_input
         lines[0] = self.partial_input + lines[0]
         self.partial_input = lines.pop()
         pending_commands = self.pending_commands
@@ -259,28 +297,46 @@ class GCodeParser:
             pending_commands.append("")
         # Handle case where multiple commands pending
         if self.is_processing_data or len(pending_commands) > 1:
-            if len(pending_commands) < 20:
-                # Check for M112 out-of-order
+            # Check for M112 out-of-order
+            if (self.m112_any_r.search(data) is not None
+                or (has_partial and lines
+                    and self.m112_any_r.search(lines[0]) is not None)):
                 for line in lines:
                     if self.m112_r.match(line) is not None:
                         self.cmd_M112({})
             if self.is_processing_data:
-                if len(pending_commands) >= 20:
+                if (not self.is_input_paused
+                    and self._check_input_throttle(eventtime)):
                     # Stop reading input
-                    self.reactor.unregister_fd(self.fd_handle)
-                    self.fd_handle = None
+                    self.input_throttle_count += 1
+                    if self.trace is not None:
+                        self.trace.add_instant("gcode", "input throttle")
+                    self.is_input_paused = True
+                    self._update_fd_wake()
                 return
         # Process commands
         self.is_processing_data = True
+        trace = self.trace
+        if trace is not None:
+            trace_start = trace.now()
+            line_count = len(pending_commands)
         while pending_commands:
             self.pending_commands = []
             with self.mutex:
                 self._process_commands(pending_commands)
             pending_commands = self.pending_commands
+            if trace is not None:
+                line_count += len(pending_commands)
         self.is_processing_data = False
+        if trace is not None:
+            trace.add_span("gcode", "process commands", trace_start,
+                           {'lines': line_count, 'bytes': len(data)})
         if self.fd_handle is None:
-            self.fd_handle = self.reactor.register_fd(self.fd,
-                                                      self._process_data)
+            self.fd_handle = self.reactor.register_fd(
+                self.fd, self._process_data, self._flush_output)
+        elif self.is_input_paused:
+            self.is_input_paused = False
+            self._update_fd_wake()
     def run_script_from_command(self, script):
         prev_need_ack = self.need_ack
         try:
@@ -293,24 +349,79 @@ class GCodeParser:
     def get_mutex(self):
         return self.mutex
     # Response handling
+    def _update_fd_wake(self):
+        if self.fd_handle is not None:
+            is_readable = (not self.is_input_paused
+                           and not self.is_output_overflow)
+            self.reactor.set_fd_wake(self.fd_handle, is_readable,
+                                     self.is_output_waiting)
+    def _queue_output(self, data, is_ack=False):
+        # Responses are buffered and written together once per reactor tick
+        if not self.output_buffer and not self.is_output_waiting:
+            self.reactor.update_timer(self.flush_timer, self.reactor.NOW)
+        self.output_buffer.append((data, is_ack))
+        self.output_size += len(data)
+        if (self.output_size > self.OUTPUT_BUFFER_MAX
+            and not self.is_output_overflow):
+            # Stop reading input until the host reads the pending output
+            logging.info("G-Code output buffer full - pausing input")
+            self.is_output_overflow = True
+            self._update_fd_wake()
+        if self.output_size > self.OUTPUT_DROP_MAX:
+            self._drop_output()
+    def _drop_output(self):
+        # Output not caused by input (eg, periodic reports) can't be
+        # limited by pausing input - discard the oldest of it.  Acks and
+        # partially written data are always kept.
+        logging.info("G-Code output buffer overrun - dropping output")
+        new_buffer = []
+        for data, is_ack in self.output_buffer:
+            if not is_ack and self.output_size > self.OUTPUT_BUFFER_MAX:
+                self.output_size -= len(data)
+                self.bytes_dropped += len(data)
+                continue
+            new_buffer.append((data, is_ack))
+        self.output_buffer = new_buffer
+    def _flush_output(self, eventtime):
+        if self.output_buffer:
+            data = "".join([d for d, is_ack in self.output_buffer])
+            try:
+                count = os.write(self.fd, data)
+                self.write_calls += 1
+            except os.error as e:
+                count = 0
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    logging.exception("Write g-code response")
+                    self.bytes_dropped += len(data)
+                    count = len(data)
+            self.bytes_written += count
+            data = data[count:]
+            self.output_buffer = []
+            self.output_size = len(data)
+            if data:
+                self.output_buffer.append((data, True))
+        # Wait for the output to become writable if data remains
+        is_waiting = not not self.output_buffer
+        is_overflow = (self.is_output_overflow
+                       and self.output_size > self.OUTPUT_BUFFER_MAX // 2)
+        if (is_waiting != self.is_output_waiting
+            or is_overflow != self.is_output_overflow):
+            self.is_output_waiting = is_waiting
+            self.is_output_overflow = is_overflow
+            self._update_fd_wake()
+        return self.reactor.NEVER
     def ack(self, msg=None):
         if not self.need_ack or self.is_fileinput:
             return
-        try:
-            if msg:
-                os.write(self.fd, "ok %s\n" % (msg,))
-            else:
-                os.write(self.fd, "ok\n")
-        except os.error:
-            logging.exception("Write g-code ack")
+        if msg:
+            self._queue_output("ok %s\n" % (msg,), is_ack=True)
+        else:
+            self._queue_output("ok\n", is_ack=True)
         self.need_ack = False
     def respond(self, msg):
         if self.is_fileinput:
             return
-        try:
-            os.write(self.fd, msg+"\n")
-        except os.error:
-            logging.exception("Write g-code response")
+        self._queue_output(msg+"\n")
     def respond_info(self, msg, log=True):
         if log:
             logging.info(msg)
@@ -480,8 +591,8 @@ class GCodeParser:
         'RESTART', 'FIRMWARE_RESTART', 'ECHO', 'STATUS', 'HELP']
     # G-Code movement commands
     cmd_G1_aliases = ['G0']
-    def cmd_G1(self, params):
-        # Move
+    def _parse_move(self, params, position):
+        # Update position (in place) with the axis parameters of a move
         try:
             for axis in 'XYZ':
                 if axis in params:
@@ -489,18 +600,18 @@ class GCodeParser:
                     pos = self.axis2pos[axis]
                     if not self.absolute_coord:
                         # value relative to position of last move
-                        self.last_position[pos] += v
+                        position[pos] += v
                     else:
                         # value relative to base coordinate position
-                        self.last_position[pos] = v + self.base_position[pos]
+                        position[pos] = v + self.base_position[pos]
             if 'E' in params:
                 v = float(params['E']) * self.extrude_factor
                 if not self.absolute_coord or not self.absolute_extrude:
                     # value relative to position of last move
-                    self.last_position[3] += v
+                    position[3] += v
                 else:
                     # value relative to base coordinate position
-                    self.last_position[3] = v + self.base_position[3]
+                    position[3] = v + self.base_position[3]
             if 'F' in params:
                 gcode_speed = float(params['F'])
                 if gcode_speed <= 0.:
@@ -510,6 +621,20 @@ class GCodeParser:
         except ValueError as e:
             raise self.error("Unable to parse move '%s'" % (
                 params['#original'],))
+    def get_move_position(self, params):
+        # Return the position a G1 command with the given params targets
+        position = list(self.last_position)
+        self._parse_move(params, position)
+        return position
+    def get_last_position(self):
+        return list(self.last_position)
+    def move_to(self, position):
+        # Move to a position as returned by get_move_position()
+        self.last_position[:] = position
+        self.move_with_transform(self.last_position, self.speed)
+    def cmd_G1(self, params):
+        # Move
+        self._parse_move(params, self.last_position)
         self.move_with_transform(self.last_position, self.speed)
     def cmd_G4(self, params):
         # Dwell
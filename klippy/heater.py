@@ -3,7 +3,7 @@
 # Copyright (C) 2016-2018  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging, threading
+import logging, threading, array
 
 
 ######################################################################
@@ -44,6 +44,8 @@ class Heater:
         self.lock = threading.Lock()
         self.last_temp = self.smoothed_temp = self.target_temp = 0.
         self.last_temp_time = 0.
+        pheaters = self.printer.lookup_object('heater')
+        self.history = pheaters.setup_history(config)
         # pwm caching
         self.next_pwm_time = 0.
         self.last_pwm_value = 0.
@@ -93,6 +95,8 @@ class Heater:
             adj_time = min(time_diff * self.inv_smooth_time, 1.)
             self.smoothed_temp += temp_diff * adj_time
             self.can_extrude = (self.smoothed_temp >= self.min_extrude_temp)
+            self.history.add(read_time, temp, self.target_temp,
+                             self.last_pwm_value)
         #logging.debug("temp: %.3f %f = %f", read_time, temp)
     # External commands
     def get_pwm_delay(self):
@@ -223,6 +227,60 @@ class ControlPID:
                 or abs(self.prev_temp_deriv) > PID_SETTLE_SLOPE)
 
 
+######################################################################
+# Temperature history
+######################################################################
+
+# Fixed size ring buffer of (time, temp, target, pwm) samples
+class TemperatureHistory:
+    def __init__(self, size):
+        self.lock = threading.Lock()
+        self.size = size
+        self.times = array.array('d', [0.] * size)
+        self.temps = array.array('d', [0.] * size)
+        self.targets = array.array('d', [0.] * size)
+        self.pwms = array.array('d', [0.] * size)
+        self.next_pos = self.count = 0
+    def add(self, read_time, temp, target, pwm):
+        with self.lock:
+            pos = self.next_pos
+            self.times[pos] = read_time
+            self.temps[pos] = temp
+            self.targets[pos] = target
+            self.pwms[pos] = pwm
+            self.next_pos = (pos + 1) % self.size
+            self.count = min(self.count + 1, self.size)
+    def get_samples(self, duration, max_points):
+        # Return the samples from the last 'duration' seconds, averaged
+        # down to at most max_points samples
+        with self.lock:
+            if not self.count:
+                return []
+            start = self.next_pos - self.count
+            positions = [(start + i) % self.size for i in range(self.count)]
+            data = [(self.times[p], self.temps[p], self.targets[p],
+                     self.pwms[p]) for p in positions]
+        end_time = data[-1][0]
+        start_time = end_time - duration
+        data = [d for d in data if d[0] >= start_time]
+        bucket_time = duration / max_points
+        out = []
+        bucket = []
+        bucket_end = start_time + bucket_time
+        for d in data + [None]:
+            if d is None or d[0] > bucket_end:
+                if bucket:
+                    cnt = float(len(bucket))
+                    out.append(tuple([sum(v) / cnt for v in zip(*bucket)]))
+                    bucket = []
+                if d is None:
+                    break
+                while d[0] > bucket_end:
+                    bucket_end += bucket_time
+            bucket.append(d)
+        return out
+
+
 ######################################################################
 # Sensor and heater lookup
 ######################################################################
@@ -233,12 +291,16 @@ class PrinterHeaters:
         self.sensor_factories = {}
         self.heaters = {}
         self.gcode_id_to_sensor = {}
+        self.histories = {}
         self.printer.register_event_handler("gcode:request_restart",
                                             self.turn_off_all_heaters)
-        # Register TURN_OFF_HEATERS command
-        gcode = self.printer.lookup_object('gcode')
+        # Register commands
+        self.gcode = gcode = self.printer.lookup_object('gcode')
         gcode.register_command("TURN_OFF_HEATERS", self.cmd_TURN_OFF_HEATERS,
                                desc=self.cmd_TURN_OFF_HEATERS_help)
+        gcode.register_command("TEMPERATURE_HISTORY",
+                               self.cmd_TEMPERATURE_HISTORY,
+                               desc=self.cmd_TEMPERATURE_HISTORY_help)
     def add_sensor_factory(self, sensor_type, sensor_factory):
         self.sensor_factories[sensor_type] = sensor_factory
     def setup_heater(self, config, gcode_id=None):
@@ -280,6 +342,18 @@ class PrinterHeaters:
             raise self.printer.config_error(
                 "G-Code sensor id %s already registered" % (gcode_id,))
         self.gcode_id_to_sensor[gcode_id] = psensor
+    def setup_history(self, config):
+        name = config.get_name().split()[-1]
+        if name in self.histories:
+            raise config.error(
+                "Temperature history %s already registered" % (name,))
+        size = config.getint('history_size', 1200, minval=1)
+        self.histories[name] = history = TemperatureHistory(size)
+        return history
+    def get_history(self, name, duration, max_points):
+        if name not in self.histories:
+            return None
+        return self.histories[name].get_samples(duration, max_points)
     def turn_off_all_heaters(self, print_time):
         for heater in self.heaters.values():
             heater.set_temp(print_time, 0.)
@@ -287,6 +361,17 @@ class PrinterHeaters:
     def cmd_TURN_OFF_HEATERS(self, params):
         print_time = self.printer.lookup_object('toolhead').get_last_move_time()
         self.turn_off_all_heaters(print_time)
+    cmd_TEMPERATURE_HISTORY_help = "Report recent temperature measurements"
+    def cmd_TEMPERATURE_HISTORY(self, params):
+        name = self.gcode.get_str('SENSOR', params)
+        duration = self.gcode.get_float('DURATION', params, 60., above=0.)
+        max_points = self.gcode.get_int('POINTS', params, 60, minval=1)
+        samples = self.get_history(name, duration, max_points)
+        if samples is None:
+            raise self.gcode.error("Unknown temperature sensor '%s'" % (name,))
+        msg = ["%.3f temp=%.2f target=%.2f pwm=%.3f" % s for s in samples]
+        self.gcode.respond_info("\n".join(
+            ["%s: %d samples" % (name, len(samples))] + msg))
 
 def add_printer_objects(config):
     config.get_printer().add_object('heater', PrinterHeaters(config))
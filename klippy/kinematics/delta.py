@@ -114,9 +114,14 @@ class DeltaKinematics:
     def check_move(self, move):
         end_pos = move.end_pos
         end_xy2 = end_pos[0]**2 + end_pos[1]**2
-        if end_xy2 <= self.limit_xy2 and not move.axes_d[2]:
-            # Normal XY move
-            return
+        if end_xy2 <= self.limit_xy2:
+            if not move.axes_d[2]:
+                # Normal XY move
+                return
+            if self.min_z <= end_pos[2] <= self.limit_z:
+                # XY+Z move that stays below the tapered build volume
+                move.limit_speed(self.max_z_velocity, move.accel)
+                return
         if self.need_home:
             raise homing.EndstopMoveError(end_pos, "Must home first")
         end_z = end_pos[2]
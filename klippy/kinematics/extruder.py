@@ -54,8 +54,10 @@ class PrinterExtruder:
         self.extrude_pos = 0.
         # Setup iterative solver
         ffi_main, ffi_lib = chelper.get_ffi()
+        self.ffi_main = ffi_main
         self.cmove = ffi_main.gc(ffi_lib.move_alloc(), ffi_lib.free)
-        self.extruder_move_fill = ffi_lib.extruder_move_fill
+        self.extruder_move_fill_pa = ffi_lib.extruder_move_fill_pa
+        self.extruder_lookahead = ffi_lib.extruder_lookahead
         self.stepper.setup_itersolve('extruder_stepper_alloc')
         # Setup SET_PRESSURE_ADVANCE command
         gcode = self.printer.lookup_object('gcode')
@@ -135,37 +137,16 @@ class PrinterExtruder:
             return flush_count
         # Calculate max_corner_v - the speed the head will accelerate
         # to after cornering.
-        for i in range(flush_count):
-            move = moves[i]
-            if not move.decel_t:
-                continue
-            cruise_v = move.cruise_v
-            max_corner_v = 0.
-            sum_t = lookahead_t
-            for j in range(i+1, flush_count):
-                fmove = moves[j]
-                if not fmove.max_start_v2:
-                    break
-                if fmove.cruise_v > max_corner_v:
-                    if (not max_corner_v
-                        and not fmove.accel_t and not fmove.cruise_t):
-                        # Start timing after any full decel moves
-                        continue
-                    if sum_t >= fmove.accel_t:
-                        max_corner_v = fmove.cruise_v
-                    else:
-                        max_corner_v = max(
-                            max_corner_v, fmove.start_v + fmove.accel * sum_t)
-                    if max_corner_v >= cruise_v:
-                        break
-                sum_t -= fmove.accel_t + fmove.cruise_t + fmove.decel_t
-                if sum_t <= 0.:
-                    break
-            else:
-                if lazy:
-                    return i
-            move.extrude_max_corner_v = max_corner_v
-        return flush_count
+        lmoves = self.ffi_main.new(
+            "struct extruder_lookahead_move[]",
+            [(m.accel_t, m.cruise_t, m.decel_t, m.start_v, m.cruise_v,
+              m.accel, m.max_start_v2) for m in moves[:flush_count]])
+        max_corner_v = self.ffi_main.new("double[]", flush_count)
+        move_count = self.extruder_lookahead(
+            lmoves, flush_count, lazy, lookahead_t, max_corner_v)
+        for i in range(move_count):
+            moves[i].extrude_max_corner_v = max_corner_v[i]
+        return move_count
     def move(self, print_time, move):
         if self.need_motor_enable:
             self.stepper.motor_enable(print_time, 1)
@@ -177,34 +158,18 @@ class PrinterExtruder:
         cruise_v = move.cruise_v * axis_r
         accel_t, cruise_t, decel_t = move.accel_t, move.cruise_t, move.decel_t
 
-        # Update for pressure advance
-        extra_accel_v = extra_decel_v = 0.
+        # Generate steps (with any extra velocity from pressure advance)
         start_pos = self.extrude_pos
+        pressure_advance = prev_pressure_d = 0.
         if (axis_d >= 0. and (move.axes_d[0] or move.axes_d[1])
             and self.pressure_advance):
-            # Calculate extra_accel_v
             pressure_advance = self.pressure_advance * move.extrude_r
             prev_pressure_d = start_pos - move.start_pos[3]
-            if accel_t:
-                npd = move.cruise_v * pressure_advance
-                extra_accel_d = npd - prev_pressure_d
-                if extra_accel_d > 0.:
-                    extra_accel_v = extra_accel_d / accel_t
-                    axis_d += extra_accel_d
-                    prev_pressure_d += extra_accel_d
-            # Calculate extra_decel_v
-            emcv = move.extrude_max_corner_v
-            if decel_t and emcv < move.cruise_v:
-                npd = max(emcv, move.end_v) * pressure_advance
-                extra_decel_d = npd - prev_pressure_d
-                if extra_decel_d < 0.:
-                    axis_d += extra_decel_d
-                    extra_decel_v = extra_decel_d / decel_t
-
-        # Generate steps
-        self.extruder_move_fill(
+        axis_d = self.extruder_move_fill_pa(
             self.cmove, print_time, accel_t, cruise_t, decel_t, start_pos,
-            start_v, cruise_v, accel, extra_accel_v, extra_decel_v)
+            axis_d, start_v, cruise_v, accel, pressure_advance,
+            prev_pressure_d, move.cruise_v, move.end_v,
+            move.extrude_max_corner_v)
         self.stepper.step_itersolve(self.cmove)
         self.extrude_pos = start_pos + axis_d
     cmd_SET_PRESSURE_ADVANCE_help = "Set pressure advance parameters"
@@ -49,9 +49,15 @@ def coordinate_descent(adj_params, params, error_func):
 # Helper to run the coordinate descent function in a background
 # process so that it does not block the main thread.
 def background_coordinate_descent(printer, adj_params, params, error_func):
+    return background_calc(printer, coordinate_descent,
+                           adj_params, params, error_func)
+
+# Helper to run a calculation function in a background process so
+# that it does not block the main thread.
+def background_calc(printer, calc_func, *args):
     parent_conn, child_conn = multiprocessing.Pipe()
     def wrapper():
-        res = coordinate_descent(adj_params, params, error_func)
+        res = calc_func(*args)
         child_conn.send(res)
         child_conn.close()
     # Start a process to perform the calculation
@@ -74,6 +80,119 @@ def background_coordinate_descent(printer, adj_params, params, error_func):
     return res
 
 
+######################################################################
+# Levenberg-Marquardt
+######################################################################
+
+# Helper code that implements the Levenberg-Marquardt algorithm.  The
+# residual_func must return a list of errors - the sum of their
+# squares is minimized.  The Jacobian is found by finite differences.
+# Returns the new params and the number of iterations performed.
+def levenberg_marquardt(adj_params, params, residual_func):
+    params = dict(params)
+    residuals = residual_func(params)
+    best_err = sum([r**2 for r in residuals])
+    logging.info("Levenberg-Marquardt initial error: %s", best_err)
+    damping = 0.001
+    rounds = 0
+    while rounds < 100:
+        rounds += 1
+        # Calculate the Jacobian of the residuals
+        jacobian = []
+        for param_name in adj_params:
+            orig = params[param_name]
+            step = max(abs(orig), 1.) * 0.000001
+            params[param_name] = orig + step
+            jacobian.append([(r2 - r) / step for r, r2 in zip(
+                residuals, residual_func(params))])
+            params[param_name] = orig
+        jtj = [[sum([a * b for a, b in zip(col1, col2)]) for col2 in jacobian]
+               for col1 in jacobian]
+        jtr = [-sum([a * r for a, r in zip(col, residuals)])
+               for col in jacobian]
+        # Find a step that reduces the error
+        while damping < 1e+10:
+            m = [[v + (damping * v if i == j else 0.)
+                  for j, v in enumerate(row)] for i, row in enumerate(jtj)]
+            step = solve_linear(m, jtr)
+            if step is not None:
+                new_params = dict(params)
+                for param_name, d in zip(adj_params, step):
+                    new_params[param_name] += d
+                new_residuals = residual_func(new_params)
+                err = sum([r**2 for r in new_residuals])
+                if err < best_err:
+                    break
+            damping *= 10.
+        else:
+            # No further improvement possible
+            break
+        improvement = best_err - err
+        params, residuals, best_err = new_params, new_residuals, err
+        damping = max(damping * 0.1, 1e-12)
+        if (improvement <= best_err * 1e-12
+            or max([abs(d) for d in step]) < 0.0000001):
+            break
+    logging.info("Levenberg-Marquardt best_err: %s  rounds: %d",
+                 best_err, rounds)
+    return params, rounds
+
+
+######################################################################
+# Linear least squares
+######################################################################
+
+# Solve the square system of linear equations (matrix * x = vector)
+# using Gaussian elimination.  Returns None if the matrix is singular.
+def solve_linear(matrix, vector):
+    count = len(vector)
+    m = [list(row) + [v] for row, v in zip(matrix, vector)]
+    max_coef = max([abs(c) for row in m for c in row[:count]])
+    for i in range(count):
+        pivot = max(range(i, count), key=lambda j: abs(m[j][i]))
+        if abs(m[pivot][i]) <= max_coef * 1e-12:
+            return None
+        m[i], m[pivot] = m[pivot], m[i]
+        for j in range(i + 1, count):
+            f = m[j][i] / m[i][i]
+            m[j] = [a - f * b for a, b in zip(m[j], m[i])]
+    # Back substitution
+    res = [0.] * count
+    for i in range(count - 1, -1, -1):
+        res[i] = (m[i][count] - sum([m[i][j] * res[j]
+                                    for j in range(i + 1, count)])) / m[i][i]
+    return res
+
+# Find the coefficients that minimize the sum of squares of
+# (dot(row, coefs) - value) using the normal equations.  Returns None
+# if the rows do not determine a unique solution.
+def linear_least_squares(rows, values):
+    count = len(rows[0])
+    matrix = [[sum([r[i] * r[j] for r in rows]) for j in range(count)]
+              for i in range(count)]
+    vector = [sum([r[i] * v for r, v in zip(rows, values)])
+              for i in range(count)]
+    return solve_linear(matrix, vector)
+
+# Fit a plane (z = x*x_adjust + y*y_adjust + z_adjust) to a list of
+# x, y, z positions
+def plane_fit(positions, params):
+    coefs = linear_least_squares([(x, y, 1.) for x, y, z in positions],
+                                 [z for x, y, z in positions])
+    if coefs is None:
+        # Not enough distinct points - fall back to coordinate descent
+        def errorfunc(params):
+            total_error = 0.
+            for x, y, z in positions:
+                total_error += (z - x*params['x_adjust'] - y*params['y_adjust']
+                                - params['z_adjust'])**2
+            return total_error
+        return coordinate_descent(params.keys(), params, errorfunc)
+    params = dict(params)
+    params['x_adjust'], params['y_adjust'], params['z_adjust'] = coefs
+    return params
+
+
 ######################################################################
 # Trilateration
 ######################################################################
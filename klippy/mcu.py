@@ -493,6 +493,7 @@ class MCU:
         self._move_count = 0
         self._stepqueues = []
         self._steppersync = None
+        self._trace = None
         # Stats
         self._stats_sumsq_base = 0.
         self._mcu_tick_avg = 0.
@@ -790,13 +791,21 @@ class MCU:
         return self._printer.get_start_args().get('debugoutput') is not None
     def is_shutdown(self):
         return self._is_shutdown
+    def set_trace(self, trace):
+        self._trace = trace
+        self._serial.set_trace(trace, self._name)
     def flush_moves(self, print_time):
         if self._steppersync is None:
             return
         clock = self.print_time_to_clock(print_time)
         if clock < 0:
             return
+        if self._trace is not None:
+            trace_start = self._trace.now()
         ret = self._ffi_lib.steppersync_flush(self._steppersync, clock)
+        if self._trace is not None:
+            self._trace.add_span(self._name, "steppersync flush",
+                                 trace_start, {'clock': clock})
         if ret:
             raise error("Internal error in MCU '%s' stepcompress" % (
                 self._name,))
@@ -848,11 +857,15 @@ def error_help(msg):
 def add_printer_objects(config):
     printer = config.get_printer()
     reactor = printer.get_reactor()
-    mainsync = clocksync.ClockSync(reactor)
-    printer.add_object('mcu', MCU(config.getsection('mcu'), mainsync))
+    estimators = clocksync.CLOCK_ESTIMATORS
+    mcu_config = config.getsection('mcu')
+    mainsync = clocksync.ClockSync(reactor, mcu_config.getchoice(
+        'clock_estimator', estimators, 'regression'))
+    printer.add_object('mcu', MCU(mcu_config, mainsync))
     for s in config.get_prefix_sections('mcu '):
-        printer.add_object(s.section, MCU(
-            s, clocksync.SecondarySync(reactor, mainsync)))
+        printer.add_object(s.section, MCU(s, clocksync.SecondarySync(
+            reactor, mainsync,
+            s.getchoice('clock_estimator', estimators, 'regression'))))
 
 def get_printer_mcu(printer, name):
     if name == 'mcu':
@@ -24,6 +24,8 @@ class SerialReader:
         self.ffi_main, self.ffi_lib = chelper.get_ffi()
         self.serialqueue = None
         self.default_cmd_queue = self.alloc_command_queue()
+        self.trace = None
+        self.trace_category = "serial"
         self.stats_buf = self.ffi_main.new('char[4096]')
         # Threading
         self.lock = threading.Lock()
@@ -143,10 +145,16 @@ class SerialReader:
                 del self.handlers[name, oid]
             else:
                 self.handlers[name, oid] = callback
+    def set_trace(self, trace, name):
+        self.trace = trace
+        self.trace_category = name + " serial"
     # Command sending
     def raw_send(self, cmd, minclock, reqclock, cmd_queue):
         self.ffi_lib.serialqueue_send(
             self.serialqueue, cmd_queue, cmd, len(cmd), minclock, reqclock)
+        if self.trace is not None:
+            self.trace.add_instant(self.trace_category, "send", {
+                'bytes': len(cmd), 'minclock': minclock, 'reqclock': reqclock})
     def send(self, msg, minclock=0, reqclock=0):
         cmd = self.msgparser.create_command(msg)
         self.raw_send(cmd, minclock, reqclock, self.default_cmd_queue)
@@ -94,20 +94,23 @@ class Move:
         self.cruise_t = cruise_r * self.move_d / cruise_v
         self.decel_t = decel_r * self.move_d / ((end_v + cruise_v) * 0.5)
     def move(self):
-        # Generate step times for the move
+        # Schedule the move and queue it for step generation
         next_move_time = self.toolhead.get_next_move_time()
+        self.toolhead.queue_step_gen(next_move_time, self)
+        self.toolhead.update_move_time(
+            self.accel_t + self.cruise_t + self.decel_t)
+    def gen_steps(self, print_time):
+        # Generate step times for the move
         if self.is_kinematic_move:
             self.toolhead.move_fill(
-                self.cmove, next_move_time,
+                self.cmove, print_time,
                 self.accel_t, self.cruise_t, self.decel_t,
                 self.start_pos[0], self.start_pos[1], self.start_pos[2],
                 self.axes_d[0], self.axes_d[1], self.axes_d[2],
                 self.start_v, self.cruise_v, self.accel)
-            self.toolhead.kin.move(next_move_time, self)
+            self.toolhead.kin.move(print_time, self)
         if self.axes_d[3]:
-            self.toolhead.extruder.move(next_move_time, self)
-        self.toolhead.update_move_time(
-            self.accel_t + self.cruise_t + self.decel_t)
+            self.toolhead.extruder.move(print_time, self)
 
 LOOKAHEAD_FLUSH_TIME = 0.250
 
@@ -119,6 +122,7 @@ class MoveQueue:
         self.queue = []
         self.leftover = 0
         self.junction_flush = LOOKAHEAD_FLUSH_TIME
+        self.trace = None
     def reset(self):
         del self.queue[:]
         self.leftover = 0
@@ -127,7 +131,11 @@ class MoveQueue:
         self.junction_flush = flush_time
     def set_extruder(self, extruder):
         self.extruder_lookahead = extruder.lookahead
+    def set_trace(self, trace):
+        self.trace = trace
     def flush(self, lazy=False):
+        if self.trace is not None:
+            trace_start = self.trace.now()
         self.junction_flush = LOOKAHEAD_FLUSH_TIME
         update_flush_count = lazy
         queue = self.queue
@@ -173,6 +181,9 @@ class MoveQueue:
             next_end_v2 = start_v2
             next_smoothed_v2 = smoothed_v2
         if update_flush_count:
+            if self.trace is not None:
+                self.trace.add_span("toolhead", "lookahead", trace_start,
+                                    {'queued': len(queue), 'flushed': 0})
             return
         # Allow extruder to do its lookahead
         move_count = self.extruder_lookahead(queue, flush_count, lazy)
@@ -182,6 +193,10 @@ class MoveQueue:
         # Remove processed moves from the queue
         self.leftover = flush_count - move_count
         del queue[:move_count]
+        if self.trace is not None:
+            self.trace.add_span("toolhead", "lookahead", trace_start,
+                                {'queued': len(queue) + move_count,
+                                 'flushed': move_count})
     def add_move(self, move):
         self.queue.append(move)
         if len(self.queue) == 1:
@@ -235,6 +250,9 @@ class ToolHead:
             'buffer_time_start', 0.250, above=0.)
         self.move_flush_time = config.getfloat(
             'move_flush_time', 0.050, above=0.)
+        self.step_generation_time = config.getfloat(
+            'step_generation_time', 0., minval=0.)
+        self.step_gen_queue = []
         self.print_time = 0.
         self.special_queuing_state = "Flushed"
         self.need_check_stall = -1.
@@ -244,6 +262,7 @@ class ToolHead:
         self.idle_flush_print_time = 0.
         self.print_stall = 0
         self.drip_completion = None
+        self.trace = None
         # Setup iterative solver
         ffi_main, ffi_lib = chelper.get_ffi()
         self.cmove = ffi_main.gc(ffi_lib.move_alloc(), ffi_lib.free)
@@ -276,9 +295,38 @@ class ToolHead:
     # Print time tracking
     def update_move_time(self, movetime):
         self.print_time += movetime
-        flush_to_time = self.print_time - self.move_flush_time
+        if self.step_gen_queue:
+            # Don't hold more than buffer_time_high of ungenerated moves
+            self._gen_queued_steps(self.print_time - self.buffer_time_high)
+        self._flush_mcu_moves()
+    def _flush_mcu_moves(self):
+        flush_to_time = self.print_time
+        if self.step_gen_queue:
+            flush_to_time = self.step_gen_queue[0][0]
+        flush_to_time -= self.move_flush_time
         for m in self.all_mcus:
             m.flush_moves(flush_to_time)
+    # Step generation
+    def queue_step_gen(self, print_time, move):
+        if not self.step_generation_time or self.special_queuing_state:
+            move.gen_steps(print_time)
+            return
+        # Delay step generation until the move is about to be flushed
+        self.step_gen_queue.append((print_time, move))
+    def _gen_queued_steps(self, gen_time):
+        if self.trace is not None:
+            trace_start = self.trace.now()
+        queue = self.step_gen_queue
+        count = 0
+        for print_time, move in queue:
+            if print_time >= gen_time:
+                break
+            move.gen_steps(print_time)
+            count += 1
+        del queue[:count]
+        if self.trace is not None and count:
+            self.trace.add_span("toolhead", "step generation", trace_start,
+                                {'moves': count})
     def _calc_print_time(self):
         curtime = self.reactor.monotonic()
         est_print_time = self.mcu.estimated_print_time(curtime)
@@ -310,6 +358,7 @@ class ToolHead:
     def _full_flush(self):
         # Transition from "Flushed"/"Priming"/main state to "Flushed" state
         self.move_queue.flush()
+        self._gen_queued_steps(self.reactor.NEVER)
         self.special_queuing_state = "Flushed"
         self.need_check_stall = -1.
         self.reactor.update_timer(self.flush_timer, self.reactor.NEVER)
@@ -321,6 +370,9 @@ class ToolHead:
         if self.special_queuing_state:
             return self._full_flush()
         self.move_queue.flush()
+        if self.step_gen_queue:
+            self._gen_queued_steps(self.reactor.NEVER)
+            self._flush_mcu_moves()
     def get_last_move_time(self):
         self._flush_lookahead()
         if self.special_queuing_state:
@@ -334,6 +386,8 @@ class ToolHead:
                 est_print_time = self.mcu.estimated_print_time(eventtime)
                 if est_print_time < self.idle_flush_print_time:
                     self.print_stall += 1
+                    if self.trace is not None:
+                        self.trace.add_instant("toolhead", "print stall")
                 self.idle_flush_print_time = 0.
             # Transition from "Flushed"/"Priming" state to "Priming" state
             self.special_queuing_state = "Priming"
@@ -357,11 +411,25 @@ class ToolHead:
     def _flush_handler(self, eventtime):
         try:
             print_time = self.print_time
-            buffer_time = print_time - self.mcu.estimated_print_time(eventtime)
+            est_print_time = self.mcu.estimated_print_time(eventtime)
+            buffer_time = print_time - est_print_time
+            if self.trace is not None:
+                self.trace.add_counter("toolhead", "buffer_time",
+                                       {'buffer_time': buffer_time})
             if buffer_time > self.buffer_time_low:
                 # Running normally - reschedule check
-                return eventtime + buffer_time - self.buffer_time_low
+                next_check = eventtime + buffer_time - self.buffer_time_low
+                if self.step_generation_time:
+                    # Generate steps for moves nearing their flush time
+                    self._gen_queued_steps(
+                        est_print_time + self.step_generation_time)
+                    self._flush_mcu_moves()
+                    next_check = min(next_check, eventtime
+                                     + .5 * self.step_generation_time)
+                return next_check
             # Under ran low buffer mark - flush lookahead queue
+            if self.trace is not None:
+                self.trace.add_instant("toolhead", "buffer low")
             self._full_flush()
             if print_time != self.print_time:
                 self.idle_flush_print_time = self.print_time
@@ -418,6 +486,9 @@ class ToolHead:
         self.commanded_pos[3] = extrude_pos
     def get_extruder(self):
         return self.extruder
+    def set_trace(self, trace):
+        self.trace = trace
+        self.move_queue.set_trace(trace)
     def drip_move(self, newpos, speed):
         # Validate move
         move = Move(self, self.commanded_pos, newpos, speed)
@@ -465,6 +536,9 @@ class ToolHead:
         is_active = buffer_time > -60. or not self.special_queuing_state
         return is_active, "print_time=%.3f buffer_time=%.3f print_stall=%d" % (
             self.print_time, max(buffer_time, 0.), self.print_stall)
+    def is_buffer_full(self, eventtime):
+        est_print_time = self.mcu.estimated_print_time(eventtime)
+        return self.print_time - est_print_time >= self.buffer_time_high
     def check_busy(self, eventtime):
         est_print_time = self.mcu.estimated_print_time(eventtime)
         lookahead_empty = not self.move_queue.queue
@@ -486,6 +560,7 @@ class ToolHead:
         self.motor_off()
     def _handle_shutdown(self):
         self.move_queue.reset()
+        del self.step_gen_queue[:]
     def get_kinematics(self):
         return self.kin
     def get_max_velocity(self):
@@ -0,0 +1,122 @@
+#!/usr/bin/env python2
+# Script to compare mcu clock estimators using samples from a klippy log
+#
+# Copyright (C) 2026  agent <agent@local>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, math, logging
+sys.path.append(os.path.join(os.path.dirname(__file__), '../klippy'))
+import clocksync
+
+WARMUP_SAMPLES = 8
+
+# Read "clock sample" debug lines (from a klippy log produced with -v)
+def parse_log(logname):
+    sessions = []
+    ports = {}
+    f = open(logname, 'rb')
+    for line in f:
+        if line.startswith('Start printer at'):
+            ports = {}
+            continue
+        parts = line.split()
+        if len(parts) != 6 or parts[:2] != ['clock', 'sample']:
+            continue
+        port = parts[2]
+        samples = ports.get(port)
+        if samples is None:
+            samples = ports[port] = []
+            sessions.append((port, samples))
+        samples.append((float(parts[3]), float(parts[4]), int(parts[5])))
+    f.close()
+    return sessions
+
+# Replay a list of samples through the host ClockSync code
+class DummyReactor:
+    def register_timer(self, callback, waketime=0.):
+        return None
+class DummySerial:
+    serialport = "replay"
+    def set_clock_est(self, freq, last_time, last_clock):
+        pass
+
+def replay(samples, mcu_freq, estimator_class):
+    sync = clocksync.ClockSync(DummyReactor(), estimator_class)
+    sync.serial = DummySerial()
+    sync.mcu_freq = mcu_freq
+    sent_time, receive_time, clock = samples[0]
+    sync.last_clock = clock
+    sync.reset_estimator(sent_time, clock)
+    # Samples with a low round-trip-time have little transmit jitter
+    rtts = sorted([rt - st for st, rt, c in samples])
+    low_rtt = rtts[len(rtts) // 4]
+    errors = []
+    low_rtt_errors = []
+    slacks = []
+    freqs = []
+    for i, (sent_time, receive_time, clock) in enumerate(samples[1:]):
+        pred_clock = sync.estimator.predict(sent_time)
+        sync._handle_clock({'clock': clock & 0xffffffff,
+                            '#sent_time': sent_time,
+                            '#receive_time': receive_time})
+        if i < WARMUP_SAMPLES:
+            continue
+        error = (clock - pred_clock) / mcu_freq
+        errors.append(error)
+        if receive_time - sent_time <= low_rtt:
+            low_rtt_errors.append(error)
+        slacks.append(sync.get_slack() / mcu_freq)
+        freqs.append(sync.clock_est[2])
+    return errors, low_rtt_errors, slacks, freqs
+
+def calc_stats(values):
+    if not values:
+        return 0., 0., 0.
+    avg = sum(values) / len(values)
+    stddev = math.sqrt(sum([(v - avg)**2 for v in values]) / len(values))
+    return avg, stddev, max([abs(v) for v in values])
+
+def guess_freq(samples):
+    first, last = samples[0], samples[-1]
+    freq = (last[2] - first[2]) / (last[0] - first[0])
+    # Round to nearest 100Khz
+    return round(freq / 100000.) * 100000.
+
+def report(port, samples, mcu_freq):
+    if mcu_freq is None:
+        mcu_freq = guess_freq(samples)
+    print("%s: %d samples over %.1f seconds (mcu_freq=%d)" % (
+        port, len(samples), samples[-1][0] - samples[0][0], mcu_freq))
+    for name, estimator_class in sorted(clocksync.CLOCK_ESTIMATORS.items()):
+        errors, low_rtt_errors, slacks, freqs = replay(
+            samples, mcu_freq, estimator_class)
+        print("  %s:" % (name,))
+        for desc, values in [("prediction error", errors),
+                             ("low rtt prediction error", low_rtt_errors),
+                             ("schedule slack", slacks)]:
+            avg, stddev, vmax = calc_stats(values)
+            print("    %s: avg=%.3fus stddev=%.3fus max=%.3fus" % (
+                desc, avg * 1000000., stddev * 1000000., vmax * 1000000.))
+        avg, stddev, vmax = calc_stats(freqs)
+        print("    frequency jitter: stddev=%.3fppm" % (
+            stddev / mcu_freq * 1000000.,))
+
+def main():
+    usage = "%prog [options] <klippy.log>"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-f", "--freq", type="float", dest="freq", default=None,
+                    help="mcu clock frequency (default: guess from samples)")
+    options, args = opts.parse_args()
+    if len(args) != 1:
+        opts.error("Incorrect number of arguments")
+    logging.basicConfig(level=logging.WARNING)
+    sessions = parse_log(args[0])
+    if not sessions:
+        opts.error("No 'clock sample' lines found (run klippy with -v)")
+    for port, samples in sessions:
+        if len(samples) <= WARMUP_SAMPLES + 1:
+            continue
+        report(port, samples, options.freq)
+
+if __name__ == '__main__':
+    main()
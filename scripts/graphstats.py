@@ -50,12 +50,97 @@ def parse_log(logname, mcu):
     f.close()
     return out
 
+# Binary stats log (as written by the stats_log option of klippy's
+# [statistics] section)
+STATS_LOG_MAGIC = "KLIPPYSTATS 1\n"
+
+def is_stats_log(logname):
+    f = open(logname, 'rb')
+    header = f.read(len(STATS_LOG_MAGIC))
+    f.close()
+    return header == STATS_LOG_MAGIC
+
+def map_stats_columns(columns, mcu_prefix, apply_prefix):
+    # Translate column names to the key names used by parse_log()
+    keys = []
+    for col in columns:
+        prefix, sep, name = col.rpartition(':')
+        if prefix + sep == mcu_prefix or name not in apply_prefix:
+            keys.append(name)
+        else:
+            keys.append(col)
+    return keys
+
+def parse_stats_log(logname, mcu, key_filter=None):
+    import mmap, struct, numpy
+    if mcu is None:
+        mcu = "mcu"
+    mcu_prefix = mcu + ":"
+    apply_prefix = { p: 1 for p in APPLY_PREFIX }
+    f = open(logname, 'rb')
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    out = []
+    pos = len(STATS_LOG_MAGIC)
+    size = len(mm)
+    keys = records = None
+    while pos < size:
+        tag = mm[pos]
+        if tag == 'S':
+            # New schema
+            if pos + 5 > size:
+                break
+            slen = struct.unpack('<I', mm[pos+1:pos+5])[0]
+            columns = mm[pos+5:pos+5+slen].split()
+            pos += 5 + slen
+            keys = map_stats_columns(columns, mcu_prefix, apply_prefix)
+            # Only extract the columns that are needed
+            indexes = [i for i, k in enumerate(keys)
+                       if key_filter is None or k == 'print_time'
+                       or key_filter(k)]
+            keys = [keys[i] for i in indexes]
+            rtype = numpy.dtype([('tag', 'S1'), ('time', '<f8'),
+                                 ('values', '<f8', (len(columns),))])
+            continue
+        if tag != 'R' or keys is None:
+            raise IOError("Corrupt stats log at offset %d" % (pos,))
+        # Map all remaining records and stop at the next schema
+        count = (size - pos) // rtype.itemsize
+        if not count:
+            break
+        records = numpy.frombuffer(mm, dtype=rtype, count=count, offset=pos)
+        bad = numpy.nonzero(records['tag'] != 'R')[0]
+        if len(bad):
+            count = bad[0]
+            records = records[:count]
+        pos += count * rtype.itemsize
+        if 'print_time' not in keys:
+            continue
+        values = records['values'][:, indexes]
+        if numpy.isnan(values).any():
+            rows = [{ k: v for k, v in zip(keys, vals) if v == v }
+                    for vals in values.tolist()]
+        else:
+            rows = [dict(zip(keys, vals)) for vals in values.tolist()]
+        for st, keyparts in zip(records['time'].tolist(), rows):
+            keyparts['#sampletime'] = st
+        out.extend(rows)
+    records = None
+    mm.close()
+    f.close()
+    return out
+
 def setup_matplotlib(output_to_file):
     if output_to_file:
         matplotlib.use('Agg')
     import matplotlib.pyplot, matplotlib.dates, matplotlib.font_manager
     import matplotlib.ticker
 
+MCU_KEYS = {
+    'bytes_write': 1, 'bytes_retransmit': 1, 'mcu_task_avg': 1,
+    'mcu_task_stddev': 1, 'mcu_awake': 1, 'buffer_time': 1,
+    'print_stall': 1
+}
+
 def find_print_restarts(data):
     runoff_samples = {}
     last_runoff_start = last_buffer_time = last_sampletime = 0.
@@ -148,7 +233,7 @@ def plot_frequency(data, mcu):
         st = datetime.datetime.utcfromtimestamp(d['#sampletime'])
         for key, (times, values) in graph_keys.items():
             val = d.get(key)
-            if val not in (None, '0', '1'):
+            if val is not None and float(val) not in (0., 1.):
                 times.append(st)
                 values.append(float(val))
 
@@ -204,6 +289,17 @@ def plot_temperature(data, heater):
     ax1.grid(True)
     return fig
 
+def get_key_filter(options):
+    # Determine which stats are needed for the requested graph
+    if options.heater is not None:
+        prefix = options.heater + ':'
+        return (lambda key: key.startswith(prefix))
+    if options.frequency:
+        one_mcu = options.mcu is not None
+        return (lambda key: key in ("freq", "adj") or (not one_mcu and (
+            key.endswith(":freq") or key.endswith(":adj"))))
+    return (lambda key: key in MCU_KEYS)
+
 def main():
     # Parse command-line arguments
     usage = "%prog [options] <logfile>"
@@ -222,7 +318,11 @@ def main():
     logname = args[0]
 
     # Parse data
-    data = parse_log(logname, options.mcu)
+    if is_stats_log(logname):
+        data = parse_stats_log(logname, options.mcu,
+                               get_key_filter(options))
+    else:
+        data = parse_log(logname, options.mcu)
     if not data:
         return
 
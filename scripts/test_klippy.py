@@ -3,7 +3,8 @@
 # Copyright (C) 2018  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import sys, os, optparse, logging, subprocess
+import sys, os, optparse, logging, subprocess, tempfile, shutil, time
+import multiprocessing
 
 TEMP_GCODE_FILE = "_test_.gcode"
 TEMP_LOG_FILE = "_test_.log"
@@ -33,7 +34,8 @@ class TestCase:
             reldir = os.path.dirname(self.fname)
         return os.path.join(reldir, fname)
     def parse_test(self):
-        # Parse file into test cases
+        # Parse file into a list of test launch parameters
+        tests = []
         config_fname = gcode_fname = dict_fnames = None
         should_fail = multi_tests = False
         gcode = []
@@ -50,12 +52,12 @@ class TestCase:
                     # Multiple tests in same file
                     if not multi_tests:
                         multi_tests = True
-                        self.launch_test(config_fname, dict_fnames,
-                                         gcode_fname, gcode, should_fail)
+                        tests.append((config_fname, dict_fnames,
+                                      gcode_fname, list(gcode), should_fail))
                 config_fname = self.relpath(parts[1])
                 if multi_tests:
-                    self.launch_test(config_fname, dict_fnames,
-                                     gcode_fname, gcode, should_fail)
+                    tests.append((config_fname, dict_fnames,
+                                  gcode_fname, list(gcode), should_fail))
             elif parts[0] == "DICTIONARY":
                 dict_fnames = [self.relpath(parts[1], 'dict')]
                 for mcu_dict in parts[2:]:
@@ -70,8 +72,9 @@ class TestCase:
                 gcode.append(line.strip())
         f.close()
         if not multi_tests:
-            self.launch_test(config_fname, dict_fnames,
-                             gcode_fname, gcode, should_fail)
+            tests.append((config_fname, dict_fnames,
+                          gcode_fname, list(gcode), should_fail))
+        return tests
     def launch_test(self, config_fname, dict_fnames, gcode_fname, gcode,
                     should_fail):
         gcode_is_temp = False
@@ -90,13 +93,23 @@ class TestCase:
         # Call klippy
         sys.stderr.write("    Starting %s (%s)\n" % (
             self.fname, os.path.basename(config_fname)))
-        args = [ sys.executable, './klippy/klippy.py', config_fname,
-                 '-i', gcode_fname, '-o', TEMP_OUTPUT_FILE, '-v' ]
+        output_fname = self.relpath(TEMP_OUTPUT_FILE, 'temp')
+        log_fname = self.relpath(TEMP_LOG_FILE, 'temp')
+        # Klippy is run from the temp directory so that files a test
+        # writes (using a relative path) are cleaned up with its output
+        abspath = os.path.abspath
+        args = [ sys.executable, abspath('./klippy/klippy.py'),
+                 abspath(config_fname), '-i', abspath(gcode_fname),
+                 '-o', abspath(output_fname), '-v' ]
         for df in dict_fnames:
-            args += ['-d', df]
+            if '=' in df:
+                mcu, fname = df.split('=', 1)
+                args += ['-d', '%s=%s' % (mcu, abspath(fname))]
+            else:
+                args += ['-d', abspath(df)]
         if not self.verbose:
-            args += ['-l', TEMP_LOG_FILE]
-        res = subprocess.call(args)
+            args += ['-l', abspath(log_fname)]
+        res = subprocess.call(args, cwd=self.tempdir)
         is_fail = (should_fail and not res) or (not should_fail and res)
         if is_fail:
             if not self.verbose:
@@ -109,16 +122,19 @@ class TestCase:
             return
         for fname in os.listdir(self.tempdir):
             if fname.startswith(TEMP_OUTPUT_FILE):
-                os.unlink(fname)
+                os.unlink(self.relpath(fname, 'temp'))
         if not self.verbose:
-            os.unlink(TEMP_LOG_FILE)
+            os.unlink(log_fname)
         else:
             sys.stderr.write('\n')
         if gcode_is_temp:
             os.unlink(gcode_fname)
-    def run(self):
+    def run(self, tests=None):
         try:
-            self.parse_test()
+            if tests is None:
+                tests = self.parse_test()
+            for test in tests:
+                self.launch_test(*test)
         except error as e:
             return str(e)
         except Exception:
@@ -126,11 +142,65 @@ class TestCase:
             return "internal error"
         return "success"
     def show_log(self):
-        f = open(TEMP_LOG_FILE, 'rb')
+        f = open(self.relpath(TEMP_LOG_FILE, 'temp'), 'rb')
         data = f.read()
         f.close()
         sys.stdout.write(data)
+        sys.stdout.flush()
+
+# Run a single test launch in its own temporary directory
+def run_isolated(params):
+    fname, test, dictdir, tempdir, keepfiles = params
+    starttime = time.time()
+    testdir = tempfile.mkdtemp(prefix='_test_', dir=tempdir)
+    tc = TestCase(fname, dictdir, testdir, False, keepfiles)
+    res = tc.run([test])
+    if not keepfiles:
+        shutil.rmtree(testdir, ignore_errors=True)
+    return fname, test[0], res, time.time() - starttime
 
+def run_parallel(args, options):
+    # Split the test files into separate test launches
+    params = []
+    for fname in args:
+        tc = TestCase(fname, options.dictdir, options.tempdir, False,
+                      options.keepfiles)
+        try:
+            tests = tc.parse_test()
+        except Exception:
+            logging.exception("Unable to parse test case %s", fname)
+            sys.exit(-1)
+        params.extend([(fname, test, options.dictdir, options.tempdir,
+                        options.keepfiles) for test in tests])
+    # Build the C helper code once before starting the workers
+    sys.path.append('./klippy')
+    import chelper
+    chelper.get_ffi()
+    # Run the tests in a pool of worker processes
+    pool = multiprocessing.Pool(options.jobs)
+    starttime = time.time()
+    results = []
+    for fname, config_fname, res, runtime in pool.imap_unordered(
+            run_isolated, params):
+        results.append((fname, os.path.basename(config_fname), res, runtime))
+    pool.close()
+    pool.join()
+    # Report results
+    sys.stderr.write("\n    Test wall times:\n")
+    for fname, config_fname, res, runtime in sorted(
+            results, key=lambda r: -r[3]):
+        sys.stderr.write("    %7.1fs  %s (%s)\n" % (
+            runtime, fname, config_fname))
+    failures = [r for r in sorted(results) if r[2] != 'success']
+    for fname, config_fname, res, runtime in failures:
+        sys.stderr.write("\n\nTest case %s (%s) FAILED (%s)!\n\n" % (
+            fname, config_fname, res))
+    if failures:
+        sys.exit(-1)
+    sys.stderr.write("\n    All %d test cases passed (%d runs in %.1fs"
+                     " with %d jobs)\n" % (len(args), len(results),
+                                           time.time() - starttime,
+                                           options.jobs))
 
 ######################################################################
 # Startup
@@ -148,11 +218,21 @@ def main():
                     help="do not remove temporary files")
     opts.add_option("-v", action="store_true", dest="verbose",
                     help="show all output from tests")
+    opts.add_option("-j", "--jobs", dest="jobs", type="int", default=1,
+                    help="number of test cases to run in parallel")
     options, args = opts.parse_args()
     if len(args) < 1:
         opts.error("Incorrect number of arguments")
+    if options.jobs < 1:
+        opts.error("Number of jobs must be at least 1")
+    if options.jobs > 1 and options.verbose:
+        opts.error("Can not use -v with parallel jobs")
     logging.basicConfig(level=logging.DEBUG)
 
+    if options.jobs > 1:
+        run_parallel(args, options)
+        return
+
     # Run each test
     for fname in args:
         tc = TestCase(fname, options.dictdir, options.tempdir, options.verbose,